@@ -1,36 +1,143 @@
+from bisect import bisect_right
+from heapq import heappush, heapreplace
+from multiprocessing import Pool
+from PairResults import PairResults
+from PrimerCandidates import PrimerCandidates
 from PrimerFinder import PrimerFinder
+from SearchReport import SearchReport
+
+
+# The finder of a worker process of a parallel scan
+worker_finder = None
+
+
+def init_worker(finder):
+    """ Initialises a worker process of a parallel scan with the
+    finder, so it is sent to every worker once instead of with every
+    chunk.
+
+    Parameters:
+        finder - The AllPrimerFinder which scans
+    Returns:
+        -
+    """
+    global worker_finder
+    worker_finder = finder
+
+
+def scan_chunk(job):
+    """ Scans a chunk in a worker process, see
+    `AllPrimerFinder.scan_chunk`. Every chunk gets a report of its own.
+
+    Parameters:
+        job - A tuple of the arguments of `AllPrimerFinder.scan_chunk`
+    Returns:
+        The scanned chunk
+    """
+    worker_finder.report = SearchReport(worker_finder.report.enabled)
+    return worker_finder.scan_chunk(*job)
 
 
 class AllPrimerFinder(PrimerFinder):
 
-    def single_primer_filter(self, item):
+    # The range of primer lengths, the maximum is exclusive
+    MIN_PRIMER_LENGTH = 17
+    MAX_PRIMER_LENGTH = 30
+    # The inclusive windows of the GC% and melting temperature
+    GC_WINDOW = (50, 60)
+    MELT_TEMP_WINDOW = (55, 65)
+    # The maximum melting temperature difference within a primer pair
+    MAX_MELT_TEMP_DIFFERENCE = 5
+    # The maximum amount of forward primers which are range checked at
+    # once, see `find_best_match`
+    PAIR_BLOCK_SIZE = 64
+    # The amount of offsets scanned by a worker in a parallel scan
+    PARALLEL_CHUNK_SIZE = 20000
+    # The amount of worker processes for scanning, None scans serially
+    processes = None
+    # The amount of offsets or primers between two progress reports
+    PROGRESS_INTERVAL = 1000
+    # A CandidateStore which is reused between searches, or None
+    candidate_store = None
+    # A SpecificityIndex of the template to reject primers which bind
+    # elsewhere in the template, or None to skip this check
+    specificity_index = None
+
+    def single_primer_filter(self, primer):
         """ This filter will be used to filter out primers which are
         not capable of being a primer. A self dimer or hairpin is not
         allowed. The settings of experimental dimer checks are honoured
-        through the PrimerChecker object.
+        through the PrimerChecker object. With a specificity_index,
+        primers which bind elsewhere in the template are not allowed
+        either.
         Parameters:
-            item - The primer to check
+            primer - The primer sequence to check
         Returns:
             A boolean whether this primer can pass (True) or not(False)
         """
-        primer = item["seq"]
-        self.set_primer_absolute_position(item)
-        return (not self.primer_checker.is_self_dimer(primer) and
-                not self.primer_checker.is_hairpin(primer))
+        rejection = self.single_primer_rejection(primer)
+        if rejection is not None:
+            self.report.reject(rejection)
+        return rejection is None
+
+    def single_primer_rejection(self, primer):
+        """ Checks a primer like `single_primer_filter`, but tells which
+        check rejected it.
+        Parameters:
+            primer - The primer sequence to check
+        Returns:
+            None when the primer passes, otherwise self_dimer, hairpin
+            or off_target
+        """
+        if self.primer_checker.is_self_dimer(primer):
+            return 'self_dimer'
+        if self.primer_checker.is_hairpin(primer):
+            return 'hairpin'
+        if (self.specificity_index is not None and
+                not self.specificity_index.is_specific(primer)):
+            return 'off_target'
+        return None
+
+    def candidate_bounds(self):
+        """ Returns the bounds of the candidates which can be part of a
+        pair at all: the range of the offsets of the forward primers and
+        the range of the ends (offset plus length) of the reverse
+        primers, both inclusive and within the annealing sequence. Only
+        the candidates within either range are checked with the
+        single_primer_filter, the others are rejected as out_of_reach.
+        Every candidate can be part of a pair without a target, which
+        is told by None, see `TargetPrimerFinder.candidate_bounds`.
+        """
+        return None
 
-    def range_primer_filter(self, forward_primer):
+    def within_bounds(self, bounds, offset, length):
+        """ Tells whether a candidate at an offset of the annealing
+        sequence is within the bounds of `candidate_bounds`.
+        """
+        (forward_minimum, forward_maximum), (reverse_minimum,
+                                             reverse_maximum) = bounds
+        return (forward_minimum <= offset <= forward_maximum or
+                reverse_minimum <= offset + length <= reverse_maximum)
+
+    def range_primer_filter(self, primers, forward_index):
         """ This method will return to check a forward primer with
         multiple reverse primers. This method makes use of the closure
         principle to store information about the forward primer. See
         actual filter for details for what it is checking for.
         Parameters:
-            forward_primer - The forward primer object
+            primers - The PrimerCandidates of the primers
+            forward_index - The index of the forward primer
         Returns:
-            A filter which takes a reverse primer as argument.
+            A filter which takes the index of a reverse primer as
+            argument.
         """
-        offset = forward_primer['offset']
-        primer = forward_primer['seq']
-        melt_temp = forward_primer['melt_temp']
+        offsets = primers.offsets
+        lengths = primers.lengths
+        melt_temps = primers.melt_temps
+        offset = offsets[forward_index]
+        end = offset + lengths[forward_index]
+        melt_temp = melt_temps[forward_index]
+        report = self.report
 
         def reverse_primer_filter(other):
             """ This method will do a few checks on the forward and
@@ -38,91 +145,643 @@ class AllPrimerFinder(PrimerFinder):
             - Whether the max_pcr_product is within limits
             - Whether the primers do not overlap
             - Whether the melting temp is less or equal than 5
-            - Whether the primers can form a dimer (in respect to the
-              experimental setting)
+            Whether the primers can form a dimer (in respect to the
+            experimental setting) is checked afterwards for a whole
+            block of combinations, see `match_block`.
+            With an enabled report, the first failing check is counted.
             Parameters:
-                other - The reverse primer object
+                other - The index of the reverse primer
             Returns:
                 Whether the primers can be a good combination (True) or
                 not (False)
             """
-            pcr_product = other['offset'] - offset + len(other['seq'])
-            melt_temp_difference = abs(other['melt_temp'] - melt_temp)
-            return (pcr_product <= self.max_pcr_product and
-                    len(primer) + offset < other['offset'] and
-                    melt_temp_difference <= 5 and
-                    not self.primer_checker.is_dimer(primer, other['seq']))
+            other_offset = offsets[other]
+            pcr_product = other_offset - offset + lengths[other]
+            melt_temp_difference = abs(melt_temps[other] - melt_temp)
+            if not report.enabled:
+                return (pcr_product <= self.max_pcr_product and
+                        end < other_offset and
+                        melt_temp_difference <= self.MAX_MELT_TEMP_DIFFERENCE)
+            for clause, passes in (
+                    ('max_pcr_product', pcr_product <= self.max_pcr_product),
+                    ('overlap', end < other_offset),
+                    ('melt_temp_difference',
+                     melt_temp_difference <= self.MAX_MELT_TEMP_DIFFERENCE)):
+                if not passes:
+                    report.reject(clause)
+                    return False
+            return True
 
         return reverse_primer_filter
 
+    def window_masks(self, sequence):
+        """ Creates the GC prefix sums and melting temperature tables of
+        a sequence and the boolean mask of every primer length, which
+        tells which offsets pass the GC% and melting temperature
+        windows, see `PrimerChecker.window_mask`.
+
+        Parameters:
+            sequence - The sequence to create the masks of
+        Returns:
+            A tuple of the GC prefix sums, the melting temperature
+            tables and a dictionary with the mask by primer length.
+        """
+        checker = self.primer_checker
+        gc_prefix = checker.gc_prefix_sums(sequence)
+        tables = checker.melt_temp_tables(sequence)
+        masks = {}
+        for primer_length in range(self.MIN_PRIMER_LENGTH,
+                                   self.MAX_PRIMER_LENGTH):
+            masks[primer_length] = checker.window_mask(
+                gc_prefix, primer_length, self.GC_WINDOW,
+                self.MELT_TEMP_WINDOW)
+        return gc_prefix, tables, masks
+
+    def scan_windows(self, sequence, offset_count, sequence_length,
+                     masks=None):
+        """ Walks the first offset_count offsets of the sequence with
+        index based windows ranging in length from 17 to 30, and keeps
+        the windows which pass the GC% and melting temperature windows.
+        Those windows are checked with boolean masks over the GC prefix
+        sums of the sequence, so no primer is counted separately. The
+        melting temperature of a window which passes the masks is
+        calculated in constant time, see
+        `PrimerChecker.calc_window_melt_temp`.
+        The windows are limited by sequence_length like they are by the
+        end of the sequence, so a chunk of a longer sequence can be
+        scanned exactly like the whole sequence would be.
+
+        Parameters:
+            sequence - The sequence to look in, it should at least
+            contain every window of the scanned offsets.
+            offset_count - The amount of offsets to scan
+            sequence_length - The length of the whole sequence, counted
+            from the start of this sequence.
+            masks - Optionally the result of `window_masks` for the
+            sequence, which are created when they are not given.
+        Returns:
+            The PrimerCandidates of the windows within the sequence, in
+            order of offset and length.
+        """
+        checker = self.primer_checker
+        gc_prefix, tables, masks = masks or self.window_masks(sequence)
+        report = self.report
+        if report.enabled:
+            # The GC counts which pass the GC% window alone, to tell the
+            # rejections of both windows apart.
+            gc_ranges = dict(
+                (primer_length, checker.gc_count_range(
+                    primer_length, self.GC_WINDOW,
+                    (float('-inf'), float('inf'))))
+                for primer_length in masks)
+        passed = PrimerCandidates(sequence, primer_checker=checker)
+        scanned = 0
+        for offset in range(offset_count):
+            if offset and offset % self.PROGRESS_INTERVAL == 0:
+                self.report_progress('candidates', scanned)
+                scanned = 0
+            end_length = min(self.MAX_PRIMER_LENGTH, sequence_length - offset)
+            scanned += max(end_length - self.MIN_PRIMER_LENGTH, 0)
+            # check multiple primer lengths
+            for primer_length in range(self.MIN_PRIMER_LENGTH, end_length):
+                if not masks[primer_length][offset]:
+                    if report.enabled:
+                        gc_length = (gc_prefix[offset + primer_length] -
+                                     gc_prefix[offset])
+                        gc_range = gc_ranges[primer_length]
+                        if (gc_range is None or
+                                not gc_range[0] <= gc_length <= gc_range[1]):
+                            report.reject('gc_window')
+                        else:
+                            report.reject('melt_temp_window')
+                    continue
+                melting_temp = checker.calc_window_melt_temp(
+                    tables, gc_prefix, offset, primer_length)
+                if not (self.MELT_TEMP_WINDOW[0] <= melting_temp <=
+                        self.MELT_TEMP_WINDOW[1]):
+                    report.reject('melt_temp_window')
+                    continue
+                passed.append(offset, primer_length,
+                              gc_prefix[offset + primer_length] -
+                              gc_prefix[offset], melting_temp)
+        self.report_progress('candidates', scanned)
+        return passed
+
+    def scan_candidates(self, sequence, masks=None):
+        """ Walks the sequence once with `scan_windows` and keeps every
+        primer candidate which passes the GC% and melting temperature
+        windows. An occurrence index of the passing primers is built,
+        so primers which occur more than once (and thus cannot be used)
+        are left out.
+
+        Parameters:
+            sequence - The annealing sequence to look in
+            masks - Optionally the result of `window_masks` for the
+            sequence
+        Returns:
+            The PrimerCandidates in order of offset and length
+        """
+        passed = self.scan_windows(
+            sequence, len(sequence) - self.MIN_PRIMER_LENGTH + 1,
+            len(sequence), masks)
+        passed.anneal_minimum = self.anneal_minimum
+        occurrences = {}
+        for index in range(len(passed)):
+            primer = passed.seq(index)
+            occurrences[primer] = occurrences.get(primer, 0) + 1
+        unique = []
+        for index in range(len(passed)):
+            # Duplicates cannot be used
+            if occurrences[passed.seq(index)] == 1:
+                unique.append(index)
+            else:
+                self.report.reject('duplicate')
+        return passed.take(unique)
+
+    def scan_chunk(self, chunk, chunk_offset, offset_count, sequence_length):
+        """ Scans a chunk of the annealing sequence and does the
+        single_primer_filter on every window which passes. This is the
+        part of `find_all_primers_parallel` which runs in a worker
+        process, duplicates are resolved afterwards.
+
+        Parameters:
+            chunk - The chunk of the annealing sequence, which overlaps
+            with the next chunk by MAX_PRIMER_LENGTH.
+            chunk_offset - The offset of the chunk in the annealing
+            sequence
+            offset_count - The amount of offsets this chunk scans
+            sequence_length - The length of the annealing sequence from
+            the start of the chunk.
+        Returns:
+            A tuple of the PrimerCandidates within the chunk, a list
+            with the rejection of single_primer_rejection (or
+            out_of_reach) of every candidate and the SearchReport of
+            the chunk.
+        """
+        with self.report.stage('enumeration'):
+            windows = self.scan_windows(chunk, offset_count, sequence_length)
+        bounds = self.candidate_bounds()
+        rejections = []
+        with self.report.stage('single_filter'):
+            for index in range(len(windows)):
+                if bounds is not None and not self.within_bounds(
+                        bounds, chunk_offset + windows.offsets[index],
+                        windows.lengths[index]):
+                    rejections.append('out_of_reach')
+                else:
+                    rejections.append(
+                        self.single_primer_rejection(windows.seq(index)))
+        return windows, rejections, self.report
+
     def find_all_primers(self, sequence):
         """ This method will find all the primers in the sequence
         ranging in length from 17 to 30. There are also checks in place
         for duplicates (which then cannot be used) and the dimer checks
-        using the single_primer_filter.
+        using the single_primer_filter. When processes is set and the
+        sequence is longer than one chunk, this is done in parallel.
 
         Parameters:
-            sequence - The sequence to look in
+            sequence - The annealing sequence to look in
         Returns:
-            A list of available primers
+            The PrimerCandidates of the available primers
         """
-        offset = 0
+        if self.processes and len(sequence) > self.PARALLEL_CHUNK_SIZE:
+            return self.find_all_primers_parallel(sequence)
+        with self.report.stage('enumeration'):
+            candidates = self.scan_candidates(sequence)
+        bounds = self.candidate_bounds()
         found_primers = []
-        primer_tracker = set()
-        # Keep looping until we cannot find primers
-        while len(sequence[offset:]) >= 17:
-            current_region = sequence[offset:]
-            offset += 1
-            # check multiple primer lengths
-            for primer_length in range(17, min(30, len(current_region))):
-                primer = current_region[:primer_length]
-                # Check for duplicates
-                if primer in primer_tracker:
-                    found_duplicates = []
-                    for idx in range(len(found_primers)):
-                        if found_primers[idx]["seq"] == primer:
-                            found_duplicates.append(idx)
-                    for idx in reversed(found_duplicates):
-                        del found_primers[idx]
-                    continue
-                # Process the primer
-                gc_perc, melting_temp = (
-                    self.primer_checker.calc_primer_details(primer))
-                if 50 <= gc_perc <= 60 and 55 <= melting_temp <= 65:
-                    primer_tracker.add(primer)
-                    found_primers.append(dict(seq=primer, gc_perc=gc_perc,
-                                              melt_temp=melting_temp,
-                                              offset=offset - 1))
-        return list(filter(self.single_primer_filter, found_primers))
+        with self.report.stage('single_filter'):
+            for index in range(len(candidates)):
+                if bounds is not None and not self.within_bounds(
+                        bounds, candidates.offsets[index],
+                        candidates.lengths[index]):
+                    self.report.reject('out_of_reach')
+                elif self.single_primer_filter(candidates.seq(index)):
+                    found_primers.append(index)
+                if (index + 1) % self.PROGRESS_INTERVAL == 0:
+                    self.report_progress('filtered', self.PROGRESS_INTERVAL)
+        return candidates.take(found_primers)
+
+    def find_all_primers_parallel(self, sequence):
+        """ Finds the same primers as `find_all_primers`, but splits the
+        sequence in chunks of PARALLEL_CHUNK_SIZE offsets which are
+        scanned and filtered in a pool of processes number of workers.
+        The chunks overlap by MAX_PRIMER_LENGTH, so every window is in
+        exactly one chunk. Primers which occur more than once over all
+        chunks are removed afterwards, like `scan_candidates` does.
+
+        Parameters:
+            sequence - The annealing sequence to look in
+        Returns:
+            The PrimerCandidates of the available primers
+        """
+        offset_count = len(sequence) - self.MIN_PRIMER_LENGTH + 1
+        jobs = []
+        for chunk_offset in range(0, max(offset_count, 0),
+                                  self.PARALLEL_CHUNK_SIZE):
+            chunk_count = min(self.PARALLEL_CHUNK_SIZE,
+                              offset_count - chunk_offset)
+            chunk = sequence[chunk_offset:chunk_offset + chunk_count +
+                             self.MAX_PRIMER_LENGTH]
+            jobs.append((chunk, chunk_offset, chunk_count,
+                         len(sequence) - chunk_offset))
+        pool = Pool(self.processes, init_worker, (self,))
+        try:
+            with self.report.stage('parallel_scan'):
+                chunks = pool.map(scan_chunk, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        occurrences = {}
+        for windows, _, chunk_report in chunks:
+            self.report.merge(chunk_report)
+            for index in range(len(windows)):
+                primer = windows.seq(index)
+                occurrences[primer] = occurrences.get(primer, 0) + 1
+        found_primers = PrimerCandidates(sequence, self.anneal_minimum,
+                                         self.primer_checker)
+        for job, (windows, rejections, _) in zip(jobs, chunks):
+            for index, rejection in enumerate(rejections):
+                if occurrences[windows.seq(index)] != 1:
+                    self.report.reject('duplicate')
+                elif rejection is not None:
+                    self.report.reject(rejection)
+                else:
+                    found_primers.append_from(windows, index, job[1])
+        return found_primers
+
+    def candidate_configuration(self):
+        """ Returns the settings which determine which windows are
+        primer candidates, so candidates can be cached per
+        configuration.
+        """
+        configuration = (self.MIN_PRIMER_LENGTH, self.MAX_PRIMER_LENGTH,
+                         tuple(self.GC_WINDOW), tuple(self.MELT_TEMP_WINDOW))
+        if self.specificity_index is not None:
+            configuration += (self.specificity_index.configuration(),)
+        return configuration
+
+    def find_candidates(self):
+        """ Finds the available primers of the anneal region, through
+        the candidate_store when one is set so earlier searches on the
+        same template are reused.
+
+        Parameters:
+            -
+        Returns:
+            The PrimerCandidates of the available primers
+        """
+        if self.candidate_store is not None:
+            return self.candidate_store.find_all_primers(self)
+        return self.find_all_primers(self.get_annealing_sequence())
 
     def find_best_match(self, primers):
         """ Finds the best match of primers which have the biggest PCR product
-        within the anneal region.
+        within the anneal region, see `find_best_pair`.
 
         Parameters:
-            primer - A list of found primers
+            primers - The PrimerCandidates of the found primers
         Returns:
             A dictionary with the forward primer and reverse primer or None
             when no combination is found.
         """
-        for _ in range(0, len(primers)):
-            forward_primer = primers[0]
-            del primers[0]
-            primer_filter = self.range_primer_filter(forward_primer)
-            for i in range(len(primers) - 1, -1, -1):
-                rprimer = dict(primers[i])
-                rprimer['seq'] = self.complement_sequence(rprimer['seq'])
-                if primer_filter(rprimer):
-                    return {'fprimer': forward_primer, 'rprimer': primers[i]}
+        pair = self.find_best_pair(primers)
+        if pair is None:
+            return None
+        forward_index, reverse_index = pair
+        return {'fprimer': primers[forward_index],
+                'rprimer': primers[reverse_index]}
+
+    def find_best_pair(self, primers):
+        """ Finds the indexes of the best match of `find_best_match`. The
+        forward primers are handled in order, and for each of them the
+        reverse primers are tried from the end of the anneal region.
+        The range checks are done for a block of forward primers at
+        once, after which the dimer checks stop at the first passing
+        pair, see `match_block`. Blocks start small, since a match is
+        usually found early on, and grow up to PAIR_BLOCK_SIZE forward
+        primers.
+        Only the reverse primers found with `reverse_candidates` are
+        checked, so the primers should be in order of offset, like
+        `find_all_primers` returns them.
+
+        Parameters:
+            primers - The PrimerCandidates of the found primers
+        Returns:
+            A tuple with the index of the forward primer and the index
+            of the reverse primer, or None when no combination is found.
+        """
+        # The reverse complements of the reverse primers, by index
+        reverse_sequences = {}
+        buckets = self.index_primers(primers)
+        block_start = 0
+        block_size = 1
+        while block_start < len(primers):
+            block = range(block_start,
+                          min(block_start + block_size, len(primers)))
+            candidates = []
+            for forward_index in block:
+                primer_filter = self.range_primer_filter(primers,
+                                                         forward_index)
+                candidates.append([
+                    i for i in self.reverse_candidates(buckets, primers,
+                                                       forward_index)
+                    if primer_filter(i)])
+            self.report_progress('pairs', sum(len(row) for row in candidates))
+            match = self.match_block(primers, block, candidates,
+                                     reverse_sequences)
+            if match is not None:
+                return match
+            block_start += block_size
+            block_size = min(block_size * 2, self.PAIR_BLOCK_SIZE)
+        return None
+
+    def reverse_sequence(self, primers, reverse_sequences, index):
+        """ Retrieves the reverse complement of a primer, which is
+        created only once per search.
+
+        Parameters:
+            primers - The PrimerCandidates of the primers
+            reverse_sequences - A dictionary of the reverse complements
+            by index, which is filled as they are created.
+            index - The index of the primer
+        Returns:
+            The reverse complement of the primer
+        """
+        if index not in reverse_sequences:
+            reverse_sequences[index] = self.complement_sequence(
+                primers.seq(index))
+        return reverse_sequences[index]
+
+    def index_primers(self, primers):
+        """ Indexes the primers by their melting temperature, in buckets
+        which are MAX_MELT_TEMP_DIFFERENCE wide. Every bucket contains
+        a list of offsets and a list of indexes of its primers, both in
+        order of the primers so offsets can be searched with bisect.
+
+        Parameters:
+            primers - The PrimerCandidates in order of offset
+        Returns:
+            A dictionary with the buckets by their number
+        """
+        buckets = {}
+        offsets = primers.offsets
+        for index, melt_temp in enumerate(primers.melt_temps):
+            bucket = int(melt_temp // self.MAX_MELT_TEMP_DIFFERENCE)
+            bucket_offsets, indexes = buckets.setdefault(bucket, ([], []))
+            bucket_offsets.append(offsets[index])
+            indexes.append(index)
+        return buckets
+
+    def reverse_candidates(self, buckets, primers, forward_index):
+        """ Looks up the reverse primers which can possibly pair with the
+        forward primer: those which start after the forward primer,
+        start within reach of max_pcr_product and are in a melting
+        temperature bucket next to the forward primer. The exact checks
+        are still up to the range_primer_filter.
+
+        Parameters:
+            buckets - The buckets from `index_primers`
+            primers - The PrimerCandidates of the primers
+            forward_index - The index of the forward primer
+        Returns:
+            A list of primer indexes, from the end of the anneal region
+            to the start.
+        """
+        offset = primers.offsets[forward_index]
+        minimum_offset = offset + primers.lengths[forward_index]
+        maximum_offset = (offset + self.max_pcr_product -
+                          self.MIN_PRIMER_LENGTH)
+        difference = self.MAX_MELT_TEMP_DIFFERENCE
+        melt_temp = primers.melt_temps[forward_index]
+        found = []
+        for bucket in range(int((melt_temp - difference) // difference),
+                            int((melt_temp + difference) // difference) + 1):
+            if bucket not in buckets:
+                continue
+            offsets, indexes = buckets[bucket]
+            found.extend(indexes[bisect_right(offsets, minimum_offset):
+                                 bisect_right(offsets, maximum_offset)])
+        found.sort(reverse=True)
+        return found
+
+    def match_block(self, primers, block, candidates, reverse_sequences):
+        """ Looks for the first pair of a block of forward primers and
+        the reverse primers which passed the range_primer_filter of
+        those forward primers which cannot form a dimer. The pairs are
+        checked in order of preference and the search stops at the first
+        pair which passes, every forward primer is prepared once for its
+        dimer checks, see `PrimerChecker.dimer_check`.
+
+        Parameters:
+            primers - The PrimerCandidates of the primers
+            block - The indexes of the forward primers
+            candidates - A list with the indexes of the passing reverse
+            primers for every forward primer, in order of preference.
+            reverse_sequences - The reverse complements by index, see
+            `reverse_sequence`.
+        Returns:
+            A tuple with the index of the forward primer and the index
+            of the reverse primer, or None when every combination can
+            form a dimer.
+        """
+        for forward_index, row in zip(block, candidates):
+            if not row:
+                continue
+            is_dimer = self.primer_checker.dimer_check(
+                primers.seq(forward_index))
+            for i in row:
+                if not is_dimer(self.reverse_sequence(primers,
+                                                      reverse_sequences, i)):
+                    return forward_index, i
+                self.report.reject('dimer')
+        return None
+
+    def pair_score(self, primers, forward_index, reverse_index):
+        """ Scores a primer pair for ranking, a higher score is better.
+        Pairs are ranked on the biggest PCR product first, then on the
+        smallest melting temperature difference and last on the
+        smallest GC% difference (GC balance).
+
+        Parameters:
+            primers - The PrimerCandidates of the primers
+            forward_index - The index of the forward primer
+            reverse_index - The index of the reverse primer
+        Returns:
+            A tuple which can be compared with other scores
+        """
+        pcr_product = (primers.offsets[reverse_index] -
+                       primers.offsets[forward_index] +
+                       primers.lengths[reverse_index])
+        return (pcr_product,
+                -abs(primers.melt_temps[reverse_index] -
+                     primers.melt_temps[forward_index]),
+                -abs(primers.gc_perc(reverse_index) -
+                     primers.gc_perc(forward_index)))
+
+    def rank_pair_indexes(self, primers, k):
+        """ Keeps the k best primer pairs according to `pair_score` in a
+        bounded heap, so memory does not depend on the amount of passing
+        pairs. Equal scores are ranked in the order `find_best_match`
+        would find them.
+        Once the heap is full, the PCR product of its worst pair bounds
+        the search, since the PCR product comes first in the score. The
+        reverse primers of a forward primer are tried from the end of
+        the anneal region, so they stop at the first one which cannot
+        reach that PCR product even with the longest primer, and the
+        search stops at the first forward primer which cannot reach it
+        with any reverse primer. A pair which passes the range checks is
+        only checked for dimers when it would enter the heap, every
+        forward primer is prepared once for those checks, see
+        `PrimerChecker.dimer_check`.
+
+        Parameters:
+            primers - The PrimerCandidates in order of offset
+            k - The maximum amount of pairs to keep
+        Returns:
+            A list of (forward index, reverse index) tuples, the best
+            pair first.
+        """
+        if k <= 0:
+            return []
+        reverse_sequences = {}
+        buckets = self.index_primers(primers)
+        offsets = primers.offsets
+        lengths = primers.lengths
+        # The end of the last primer, no PCR product reaches beyond it
+        last_end = max([offsets[index] + lengths[index]
+                        for index in range(len(primers))] or [0])
+        # The longest a reverse primer can be
+        longest = self.MAX_PRIMER_LENGTH - 1
+        heap = []
+        for forward_index in range(len(primers)):
+            offset = offsets[forward_index]
+            if (len(heap) == k and
+                    min(self.max_pcr_product, last_end - offset) <
+                    heap[0][0][0]):
+                break
+            primer_filter = self.range_primer_filter(primers, forward_index)
+            is_dimer = None
+            evaluated = 0
+            for i in self.reverse_candidates(buckets, primers,
+                                             forward_index):
+                if (len(heap) == k and
+                        offsets[i] + longest - offset < heap[0][0][0]):
+                    break
+                evaluated += 1
+                if not primer_filter(i):
+                    continue
+                item = (self.pair_score(primers, forward_index, i),
+                        -forward_index, i)
+                if len(heap) == k and item < heap[0]:
+                    continue
+                if is_dimer is None:
+                    is_dimer = self.primer_checker.dimer_check(
+                        primers.seq(forward_index))
+                if is_dimer(self.reverse_sequence(primers, reverse_sequences,
+                                                  i)):
+                    self.report.reject('dimer')
+                    continue
+                if len(heap) < k:
+                    heappush(heap, item)
+                else:
+                    heapreplace(heap, item)
+            self.report_progress('pairs', evaluated)
+        heap.sort(reverse=True)
+        return [(-forward_index, i) for _, forward_index, i in heap]
+
+    def rank_pairs(self, primers, k):
+        """ Ranks the k best pairs, see `rank_pair_indexes`.
+
+        Parameters:
+            primers - The PrimerCandidates in order of offset
+            k - The maximum amount of pairs to keep
+        Returns:
+            A list of (forward primer, reverse primer) tuples, the best
+            pair first.
+        """
+        return [(primers[forward_index], primers[reverse_index])
+                for forward_index, reverse_index
+                in self.rank_pair_indexes(primers, k)]
+
+    def create_match(self, forward_primer, reverse_primer):
+        """ Creates the match of a primer pair like it is shown to the
+        user. The reverse primer is changed in place, so every match
+        should get Primer objects of its own.
+
+        Parameters:
+            forward_primer - The forward Primer
+            reverse_primer - The reverse Primer
+        Returns:
+            A dictionary with the forward primer, reverse primer and
+            the PCR product.
+        """
+        match = {'fprimer': forward_primer, 'rprimer': reverse_primer}
+        start_forward = forward_primer['position'][0]
+        end_reverse = reverse_primer['position'][1]
+        match['pcr'] = self.sequence[start_forward:end_reverse]
+        reverse_primer['seq'] = self.complement_sequence(
+            reverse_primer['seq'], False)
+        return match
 
     def find_primers(self):
-        sequence = self.get_annealing_sequence()
-        primers = self.find_all_primers(sequence)
-        match = self.find_best_match(primers)
+        """ Finds the best primer pair within the anneal region, see
+        `find_best_match`. The report of the search is available as the
+        report of this finder, also when no pair is found; with an
+        enabled report it is added to the match as well.
+
+        Parameters:
+            -
+        Returns:
+            A match with the forward primer, reverse primer, PCR product
+            and optionally the report, or None when no pair is found.
+        """
+        primers = self.find_candidates()
+        with self.report.stage('pairing'):
+            match = self.find_best_match(primers)
         if match:
-            start_forward = match['fprimer']['position'][0]
-            end_reverse = match['rprimer']['position'][1]
-            match['pcr'] = self.sequence[start_forward:end_reverse]
-            match['rprimer']['seq'] = self.complement_sequence(
-                match['rprimer']['seq'], False)
+            match = self.create_match(match['fprimer'], match['rprimer'])
+            if self.report.enabled:
+                match['report'] = self.report.as_dict()
         return match
+
+    def find_ranked_pairs(self, k):
+        """ Finds the k best primer pairs within the anneal region,
+        ranked by `pair_score`. The report of the search is available
+        as the report of this finder.
+
+        Parameters:
+            k - The maximum amount of primer pairs to return
+        Returns:
+            A list of matches like `find_primers` returns, the best
+            match first. The list is empty when no pair is found.
+        """
+        primers = self.find_candidates()
+        with self.report.stage('ranking'):
+            pairs = self.rank_pairs(primers, k)
+        return [self.create_match(forward_primer, reverse_primer)
+                for forward_primer, reverse_primer in pairs]
+
+    def find_pair_results(self, k=None):
+        """ Finds primer pairs within the anneal region as PairResults,
+        which only create the matches and rows which are asked for.
+        Without k only the pair of `find_best_match` is found, which
+        stops at the first passing pair. With k the k best pairs are
+        ranked like `find_ranked_pairs`, which evaluates far more pairs.
+
+        Parameters:
+            k - The maximum amount of ranked primer pairs, or None for
+            the best match only.
+        Returns:
+            The PairResults, the best pair first
+        """
+        primers = self.find_candidates()
+        if k is None:
+            with self.report.stage('pairing'):
+                pair = self.find_best_pair(primers)
+            pairs = [pair] if pair is not None else []
+        else:
+            with self.report.stage('ranking'):
+                pairs = self.rank_pair_indexes(primers, k)
+        return PairResults(self, primers, pairs)
@@ -0,0 +1,562 @@
+import argparse
+import csv
+import json
+import sys
+from collections import OrderedDict
+from multiprocessing import Pool
+from PrimerChecker import PrimerChecker
+from AllPrimerFinder import AllPrimerFinder
+from TargetPrimerFinder import TargetPrimerFinder
+from CandidateStore import CandidateSession
+from MultiplexDesigner import MultiplexDesigner
+from TilingDesigner import TilingDesigner
+from PrimerCache import PrimerCache
+from SearchReport import SearchReport
+from SpecificityIndex import SpecificityIndex
+
+
+# The columns of the result table written by `write_results`
+RESULT_COLUMNS = ("name", "status", "fprimer", "fprimer_position",
+                  "fprimer_melt_temp", "fprimer_gc_perc", "rprimer",
+                  "rprimer_position", "rprimer_melt_temp", "rprimer_gc_perc",
+                  "pcr", "report", "error")
+# The candidate sessions of this (worker) process by cache directory
+sessions = {}
+# The SpecificityIndex of the most recent templates of this (worker)
+# process, by template digest and specificity settings
+specificity_indexes = OrderedDict()
+# The maximum amount of SpecificityIndex kept by a (worker) process
+MAX_SPECIFICITY_INDEXES = 4
+
+
+def read_fasta(handle):
+    """ Reads the records of a (multi) FASTA file one at a time, so
+    the whole file never has to be in memory.
+
+    Parameters:
+        handle - An opened FASTA file
+    Returns:
+        A generator of (name, sequence) tuples. The name is the first
+        word of the header.
+    """
+    name = None
+    lines = []
+    for line in handle:
+        line = line.strip()
+        if line.startswith(">"):
+            if name is not None:
+                yield name, "".join(lines)
+            name = (line[1:].split() or [""])[0]
+            lines = []
+        elif line:
+            lines.append(line)
+    if name is not None:
+        yield name, "".join(lines)
+
+
+def read_setting_rows(handle):
+    """ Reads the settings table, which is tab separated and has a
+    header with the columns name, anneal_minimum, anneal_maximum and
+    max_pcr. The columns target_minimum and target_maximum are
+    optional, when both are filled in for a record the target is used.
+
+    Parameters:
+        handle - An opened settings file
+    Returns:
+        A generator of (record name, settings) tuples in order of the
+        table.
+    """
+    for row in csv.DictReader(handle, delimiter="\t"):
+        record = dict(anneal_minimum=int(row["anneal_minimum"]),
+                      anneal_maximum=int(row["anneal_maximum"]),
+                      max_pcr=int(row["max_pcr"]))
+        if row.get("target_minimum") and row.get("target_maximum"):
+            record["target_minimum"] = int(row["target_minimum"])
+            record["target_maximum"] = int(row["target_maximum"])
+        yield row["name"], record
+
+
+def read_settings(handle):
+    """ Reads the settings table like `read_setting_rows`, the last
+    row of a record name is used.
+
+    Parameters:
+        handle - An opened settings file
+    Returns:
+        A dictionary with the settings by record name
+    """
+    return dict(read_setting_rows(handle))
+
+
+def create_jobs(records, settings, checker_settings, cache_directory=None,
+                report=False, specificity_settings=None):
+    """ Combines the FASTA records with their settings to jobs for
+    `design_record`.
+
+    Parameters:
+        records - An iterable of (name, sequence) tuples
+        settings - The settings by record name, see `read_settings`
+        checker_settings - The keyword arguments for the PrimerChecker
+        cache_directory - The directory of the PrimerCache or None
+        report - Whether to instrument the searches with a SearchReport
+        specificity_settings - The keyword arguments for the
+        SpecificityIndex of every record, or None to skip the
+        specificity check.
+    Returns:
+        A generator of jobs, which are tuples of the name, sequence,
+        record settings (or None when missing), checker settings, cache
+        directory, report setting and specificity settings.
+    """
+    for name, sequence in records:
+        yield (name, sequence, settings.get(name), checker_settings,
+               cache_directory, report, specificity_settings)
+
+
+def get_session(cache_directory):
+    """ Retrieves the CandidateSession of this process for a cache
+    directory, every worker process opens the cache once.
+
+    Parameters:
+        cache_directory - The directory of the PrimerCache
+    Returns:
+        A CandidateSession
+    """
+    if cache_directory not in sessions:
+        sessions[cache_directory] = CandidateSession(
+            PrimerCache(cache_directory))
+    return sessions[cache_directory]
+
+
+def get_specificity_index(finder, specificity_settings):
+    """ Retrieves the SpecificityIndex of the template of a finder, so
+    every (worker) process builds the index of a template once. Only
+    the indexes of the MAX_SPECIFICITY_INDEXES most recently used
+    templates are kept.
+
+    Parameters:
+        finder - The PrimerFinder of the template
+        specificity_settings - The keyword arguments for the
+        SpecificityIndex
+    Returns:
+        A SpecificityIndex
+    """
+    key = (finder.sequence_digest(),
+           tuple(sorted(specificity_settings.items())))
+    index = specificity_indexes.pop(key, None)
+    if index is None:
+        while len(specificity_indexes) >= MAX_SPECIFICITY_INDEXES:
+            specificity_indexes.popitem(last=False)
+        index = SpecificityIndex(finder.sequence, **specificity_settings)
+    specificity_indexes[key] = index
+    return index
+
+
+def create_finder(primer_checker, sequence, settings):
+    """ Creates the correct finder for the settings of a record, a
+    TargetPrimerFinder when a target is given and an AllPrimerFinder
+    otherwise.
+
+    Parameters:
+        primer_checker - The PrimerChecker to use
+        sequence - The sequence of the record
+        settings - The settings of the record
+    Returns:
+        A PrimerFinder object
+    """
+    arguments = [primer_checker, sequence, settings["anneal_minimum"],
+                 settings["anneal_maximum"], settings["max_pcr"]]
+    if "target_minimum" in settings:
+        return TargetPrimerFinder(*(arguments +
+                                    [settings["target_minimum"],
+                                     settings["target_maximum"]]))
+    return AllPrimerFinder(*arguments)
+
+
+def configure_finder(finder, cache_directory=None, report=False,
+                     specificity_index=None):
+    """ Sets up a finder with the optional parts of a search.
+
+    Parameters:
+        finder - The PrimerFinder to set up
+        cache_directory - The directory of the PrimerCache or None
+        report - Whether to instrument the search with a SearchReport
+        specificity_index - The SpecificityIndex of the sequence, or
+        None to skip the specificity check.
+    Returns:
+        The finder
+    """
+    if specificity_index is not None:
+        finder.specificity_index = specificity_index
+    if cache_directory:
+        finder.candidate_store = get_session(cache_directory).store_for(
+            finder)
+    finder.report = SearchReport(report)
+    return finder
+
+
+def fill_match(result, match):
+    """ Fills in the primer columns of a result with a match.
+
+    Parameters:
+        result - The result dictionary
+        match - A match like `PrimerFinder.find_primers` returns
+    Returns:
+        -
+    """
+    result["status"] = "found"
+    for key in "fprimer", "rprimer":
+        primer = match[key]
+        result[key] = primer["seq"]
+        result[key + "_position"] = "{}..{}".format(*primer["position"])
+        result[key + "_melt_temp"] = primer["melt_temp"]
+        result[key + "_gc_perc"] = primer["gc_perc"]
+    result["pcr"] = len(match["pcr"])
+
+
+def fill_error(result, error):
+    """ Marks a result as failed, with the type and message of the
+    exception in the error column.
+
+    Parameters:
+        result - The result dictionary
+        error - The exception which made the design fail
+    Returns:
+        -
+    """
+    result["status"] = "error"
+    result["error"] = "{}: {}".format(type(error).__name__, error)
+
+
+def design_record(job):
+    """ Designs the primers for a single record. This is the function
+    which runs in the worker processes. A record which cannot be
+    designed, for instance because of an unknown nucleotide, gets the
+    status error instead of stopping the whole batch.
+
+    Parameters:
+        job - A job from `create_jobs`
+    Returns:
+        A dictionary with the RESULT_COLUMNS as keys
+    """
+    (name, sequence, settings, checker_settings, cache_directory,
+     report, specificity_settings) = job
+    result = dict.fromkeys(RESULT_COLUMNS, "")
+    result["name"] = name
+    if settings is None:
+        result["status"] = "no settings"
+        return result
+    try:
+        finder = create_finder(PrimerChecker(**checker_settings), sequence,
+                               settings)
+        specificity_index = None
+        if specificity_settings is not None:
+            specificity_index = get_specificity_index(finder,
+                                                      specificity_settings)
+        configure_finder(finder, cache_directory, report, specificity_index)
+        match = finder.find_primers()
+    except Exception as error:
+        fill_error(result, error)
+        return result
+    if report:
+        result["report"] = json.dumps(finder.report.as_dict(),
+                                      sort_keys=True)
+    if not match:
+        result["status"] = "no primers found"
+        return result
+    fill_match(result, match)
+    return result
+
+
+def design_tiling(job):
+    """ Designs a tiling of overlapping amplicons across the target of a
+    single record, see TilingDesigner. The primers anneal within the
+    anneal range and max_pcr is the maximum amplicon size. This is the
+    function which runs in the worker processes.
+
+    Parameters:
+        job - A job from `create_jobs` with the minimum overlap of the
+        amplicons added.
+    Returns:
+        A list with a result dictionary for every amplicon, of which the
+        names are numbered from 1, or a single result when there is no
+        tiling or the record cannot be designed. The report is added to
+        the first result.
+    """
+    (name, sequence, settings, checker_settings, cache_directory,
+     report, specificity_settings, overlap) = job
+    result = dict.fromkeys(RESULT_COLUMNS, "")
+    result["name"] = name
+    if settings is None:
+        result["status"] = "no settings"
+        return [result]
+    if "target_minimum" not in settings:
+        result["status"] = "no target"
+        return [result]
+    try:
+        finder = create_finder(
+            PrimerChecker(**checker_settings), sequence,
+            dict((key, settings[key]) for key in
+                 ("anneal_minimum", "anneal_maximum", "max_pcr")))
+        specificity_index = None
+        if specificity_settings is not None:
+            specificity_index = get_specificity_index(finder,
+                                                      specificity_settings)
+        configure_finder(finder, cache_directory, report, specificity_index)
+        matches = TilingDesigner(finder, settings["target_minimum"],
+                                 settings["target_maximum"], overlap).design()
+    except Exception as error:
+        fill_error(result, error)
+        return [result]
+    results = [result]
+    if not matches:
+        result["status"] = "no tiling found"
+    else:
+        for number, match in enumerate(matches, 1):
+            if number > 1:
+                result = dict.fromkeys(RESULT_COLUMNS, "")
+                results.append(result)
+            result["name"] = "{}_{}".format(name, number)
+            fill_match(result, match)
+    if report:
+        results[0]["report"] = json.dumps(finder.report.as_dict(),
+                                          sort_keys=True)
+    return results
+
+
+def design_multiplex(records, setting_rows, checker_settings,
+                     candidates_per_target=None, cache_directory=None,
+                     report=False, specificity_settings=None):
+    """ Designs every target of the settings table as one multiplex
+    panel, see MultiplexDesigner. Every row of the settings table is a
+    target on the record with its name, so a record can have more than
+    one target.
+
+    Parameters:
+        records - An iterable of (name, sequence) tuples
+        setting_rows - The settings rows, see `read_setting_rows`
+        checker_settings - The keyword arguments for the PrimerChecker
+        candidates_per_target - The amount of candidate pairs of every
+        target, or None for the default of MultiplexDesigner.
+        cache_directory - The directory of the PrimerCache or None
+        report - Whether to instrument the searches with a SearchReport
+        specificity_settings - The keyword arguments for the
+        SpecificityIndex of every record, or None to skip the
+        specificity check.
+    Returns:
+        A list with a result dictionary for every target, in order of
+        the settings table. A target which cannot be designed gets the
+        status error, without stopping the other targets.
+    """
+    sequences = dict(records)
+    primer_checker = PrimerChecker(**checker_settings)
+    designer = MultiplexDesigner(primer_checker, candidates_per_target)
+    results = []
+    finders = []
+    for name, settings in setting_rows:
+        result = dict.fromkeys(RESULT_COLUMNS, "")
+        result["name"] = name
+        results.append(result)
+        if name not in sequences:
+            result["status"] = "no sequence"
+            continue
+        try:
+            finder = create_finder(primer_checker, sequences[name],
+                                   settings)
+            specificity_index = None
+            if specificity_settings is not None:
+                specificity_index = get_specificity_index(
+                    finder, specificity_settings)
+            configure_finder(finder, cache_directory, report,
+                             specificity_index)
+        except Exception as error:
+            fill_error(result, error)
+            continue
+        designer.add_target(name, finder)
+        finders.append((result, finder))
+    panel = designer.design()
+    for target, ((result, finder), (_, match)) in enumerate(zip(finders,
+                                                                panel)):
+        if report:
+            result["report"] = json.dumps(finder.report.as_dict(),
+                                          sort_keys=True)
+        start, end = designer.target_ranges[target]
+        if designer.target_errors[target] is not None:
+            fill_error(result, designer.target_errors[target])
+        elif match is not None:
+            fill_match(result, match)
+        elif start == end:
+            result["status"] = "no primers found"
+        else:
+            result["status"] = "no compatible primers"
+    return results
+
+
+def write_results(results, handle):
+    """ Writes the results as a tab separated table, every result is
+    written (and flushed) as soon as it is available.
+
+    Parameters:
+        results - An iterable of result dictionaries
+        handle - An opened file to write to
+    Returns:
+        The amount of written results
+    """
+    handle.write("\t".join(RESULT_COLUMNS) + "\n")
+    written = 0
+    for result in results:
+        handle.write("\t".join(str(result[column])
+                               for column in RESULT_COLUMNS) + "\n")
+        handle.flush()
+        written += 1
+    return written
+
+
+def parse_arguments(argv):
+    """ Parses the command line arguments of the batch designer.
+
+    Parameters:
+        argv - The command line arguments without the program name
+    Returns:
+        The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Designs primers for every record of a multi FASTA "
+                    "file without the GUI.")
+    parser.add_argument("fasta", help="The (multi) FASTA file")
+    parser.add_argument("settings",
+                        help="Tab separated settings table with the columns "
+                             "name, anneal_minimum, anneal_maximum, max_pcr "
+                             "and optionally target_minimum and "
+                             "target_maximum")
+    parser.add_argument("-o", "--output", default="-",
+                        help="The result table, standard output by default")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="The amount of worker processes, the amount of "
+                             "cores by default")
+    parser.add_argument("-c", "--chunksize", type=int, default=4,
+                        help="The amount of records sent to a worker at once")
+    parser.add_argument("--cache", default=None,
+                        help="Directory of a persistent cache of the primer "
+                             "candidates of every template")
+    parser.add_argument("--report", action="store_true",
+                        help="Adds the stage times and filter rejections of "
+                             "every search as JSON to the results")
+    parser.add_argument("--specificity", action="store_true",
+                        help="Rejects primers which bind elsewhere in the "
+                             "template on either strand")
+    parser.add_argument("--seed-length", type=int, default=10,
+                        help="The 3' end of a primer which has to match a "
+                             "binding site exactly")
+    parser.add_argument("--max-mismatches", type=int, default=3,
+                        help="The mismatches allowed in the rest of a primer "
+                             "at a binding site")
+    parser.add_argument("--required-bonds", type=int, default=6,
+                        help="The bonds required for a dimer or hairpin")
+    parser.add_argument("--multiplex", action="store_true",
+                        help="Designs all targets of the settings table as "
+                             "one panel without dimers between the pairs")
+    parser.add_argument("--candidates-per-target", type=int, default=None,
+                        help="The amount of ranked candidate pairs of every "
+                             "target of a multiplex panel")
+    parser.add_argument("--tiling", action="store_true",
+                        help="Designs overlapping amplicons of at most "
+                             "max_pcr across the target of every record")
+    parser.add_argument("--overlap", type=int, default=50,
+                        help="The minimum overlap of two tiled amplicons")
+    parser.add_argument("--nearest-neighbor", action="store_true",
+                        help="Calculates melting temperatures with the "
+                             "nearest-neighbor model instead of the Wallace "
+                             "rule")
+    parser.add_argument("--sodium", type=float, default=50,
+                        help="The monovalent cation concentration in mM for "
+                             "the nearest-neighbor model")
+    parser.add_argument("--primer-concentration", type=float, default=250,
+                        help="The primer concentration in nM for the "
+                             "nearest-neighbor model")
+    parser.add_argument("--free-energy", action="store_true",
+                        help="Checks dimers and hairpins by their Gibbs free "
+                             "energy instead of the required bonds")
+    parser.add_argument("--dimer-delta-g", type=float, default=-9.0,
+                        help="The free energy in kcal/mol at or below which "
+                             "primers form a (self) dimer")
+    parser.add_argument("--hairpin-delta-g", type=float, default=-3.0,
+                        help="The free energy in kcal/mol at or below which "
+                             "a primer forms a hairpin")
+    for check in "dimer", "self-dimer", "hairpin":
+        parser.add_argument("--no-" + check, action="store_true",
+                            help="Disables the experimental {} check"
+                            .format(check.replace("-", " ")))
+    arguments = parser.parse_args(argv)
+    if not 1 <= arguments.seed_length <= AllPrimerFinder.MIN_PRIMER_LENGTH:
+        parser.error("--seed-length should be between 1 and the length of "
+                     "the shortest primer ({})".format(
+                         AllPrimerFinder.MIN_PRIMER_LENGTH))
+    return arguments
+
+
+def main(argv=None):
+    """ Runs the batch designer, the records are designed in a pool of
+    worker processes and written in order of the FASTA file.
+
+    Parameters:
+        argv - The command line arguments, sys.argv by default
+    Returns:
+        -
+    """
+    arguments = parse_arguments(sys.argv[1:] if argv is None else argv)
+    checker_settings = dict(
+        required_bonds=arguments.required_bonds,
+        dimer=not arguments.no_dimer, self_dimer=not arguments.no_self_dimer,
+        hairpin=not arguments.no_hairpin,
+        nearest_neighbor=arguments.nearest_neighbor, sodium=arguments.sodium,
+        primer_concentration=arguments.primer_concentration,
+        free_energy=arguments.free_energy,
+        dimer_delta_g=arguments.dimer_delta_g,
+        hairpin_delta_g=arguments.hairpin_delta_g)
+    specificity_settings = None
+    if arguments.specificity:
+        specificity_settings = dict(seed_length=arguments.seed_length,
+                                    max_mismatches=arguments.max_mismatches)
+    output = (sys.stdout if arguments.output == "-"
+              else open(arguments.output, "w"))
+    if arguments.multiplex:
+        try:
+            with open(arguments.fasta) as fasta_file, \
+                    open(arguments.settings) as settings_file:
+                write_results(design_multiplex(
+                    read_fasta(fasta_file), read_setting_rows(settings_file),
+                    checker_settings, arguments.candidates_per_target,
+                    arguments.cache, arguments.report,
+                    specificity_settings), output)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        return
+    with open(arguments.settings) as settings_file:
+        settings = read_settings(settings_file)
+    pool = Pool(arguments.processes)
+    try:
+        with open(arguments.fasta) as fasta_file:
+            jobs = create_jobs(read_fasta(fasta_file), settings,
+                               checker_settings, arguments.cache,
+                               arguments.report, specificity_settings)
+            if arguments.tiling:
+                jobs = (job + (arguments.overlap,) for job in jobs)
+                results = (result for tiling in pool.imap(
+                    design_tiling, jobs, arguments.chunksize)
+                    for result in tiling)
+            else:
+                results = pool.imap(design_record, jobs, arguments.chunksize)
+            write_results(results, output)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
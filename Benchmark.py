@@ -0,0 +1,223 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+from timeit import default_timer
+from PrimerChecker import PrimerChecker
+from AllPrimerFinder import AllPrimerFinder
+from TargetPrimerFinder import TargetPrimerFinder
+
+
+# The template sizes which are benchmarked by default
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+def synthetic_template(length, gc_content, repeat_fraction, seed):
+    """ Creates a reproducible random template. The nucleotides are
+    drawn with the given GC content, after which segments of the
+    template are copied to other places until repeat_fraction of the
+    template consists of repeats.
+
+    Parameters:
+        length - The length of the template
+        gc_content - The chance of a nucleotide being G or C (0 to 1)
+        repeat_fraction - The part of the template which is repeated
+        seed - The seed of the random generator
+    Returns:
+        The template as a string
+    """
+    generator = random.Random(seed)
+    template = [generator.choice("GC") if generator.random() < gc_content
+                else generator.choice("AT") for _ in range(length)]
+    repeated = 0
+    while repeated < repeat_fraction * length:
+        repeat_length = min(generator.randint(50, 500), length // 2)
+        if repeat_length < 1:
+            break
+        source = generator.randint(0, length - repeat_length)
+        target = generator.randint(0, length - repeat_length)
+        template[target:target + repeat_length] = \
+            template[source:source + repeat_length]
+        repeated += repeat_length
+    return "".join(template)
+
+
+def time_stage(results, stage, function, *args):
+    """ Times a single stage and stores its wall time in the results.
+
+    Parameters:
+        results - The dictionary of stage results to add to
+        stage - The name of the stage
+        function - The function which runs the stage
+        *args - The arguments of the function
+    Returns:
+        The return value of the function
+    """
+    start = default_timer()
+    value = function(*args)
+    results[stage] = dict(seconds=default_timer() - start)
+    return value
+
+
+def count_evaluated_pairs(pair_finder, function, primers):
+    """ Runs a pairing stage again, untimed, and counts the pairs it
+    evaluates. Every pair which is evaluated goes through the
+    range_primer_filter of its forward primer before its dimer check,
+    so the calls of those filters are counted.
+
+    Parameters:
+        pair_finder - The finder of the stage
+        function - The function which runs the stage
+        primers - The PrimerCandidates to pair
+    Returns:
+        The amount of evaluated pairs
+    """
+    evaluated = [0]
+    range_primer_filter = pair_finder.range_primer_filter
+
+    def counting_filter(found, forward_index):
+        primer_filter = range_primer_filter(found, forward_index)
+
+        def counted_filter(other):
+            evaluated[0] += 1
+            return primer_filter(other)
+        return counted_filter
+
+    pair_finder.range_primer_filter = counting_filter
+    try:
+        function(primers)
+    finally:
+        del pair_finder.range_primer_filter
+    return evaluated[0]
+
+
+def benchmark_template(template, max_pcr, seed):
+    """ Runs every stage of the primer design pipeline on a template
+    separately and measures its throughput: the GC% and melting
+    temperature masks, candidate enumeration with those masks, the self
+    dimer and hairpin filter, pairing, ranking and pairing with a
+    target. The stages do not overlap, so their times can be added up.
+
+    Parameters:
+        template - The template to benchmark with
+        max_pcr - The maximum PCR product size
+        seed - The seed used for the target range
+    Returns:
+        A dictionary with the results of every stage
+    """
+    length = len(template)
+    checker = PrimerChecker()
+    finder = AllPrimerFinder(checker, template, 1, length, max_pcr)
+    sequence = finder.get_annealing_sequence()
+    stages = {}
+
+    masks = time_stage(stages, "gc_tm_masks", finder.window_masks, sequence)
+    candidates = time_stage(stages, "enumeration",
+                            finder.scan_candidates, sequence, masks)
+    primers = time_stage(stages, "single_filter", lambda: candidates.take(
+        [index for index in range(len(candidates))
+         if finder.single_primer_filter(candidates.seq(index))]))
+    for stage in "gc_tm_masks", "enumeration", "single_filter":
+        stages[stage]["bases_per_second"] = (
+            length / stages[stage]["seconds"] if stages[stage]["seconds"]
+            else None)
+    stages["enumeration"]["candidates"] = len(candidates)
+    stages["single_filter"]["primers"] = len(primers)
+    # Pairing stages, of which the evaluated pairs are counted
+    generator = random.Random(seed)
+    target_minimum = generator.randint(1, max(length - max_pcr // 2, 1))
+    target_maximum = min(target_minimum + max_pcr // 4, length)
+    target_finder = TargetPrimerFinder(checker, template, 1, length, max_pcr,
+                                       target_minimum, target_maximum)
+    for stage, pair_finder, function in (
+            ("pairing", finder, finder.find_best_match),
+            ("ranking", finder, lambda found: finder.rank_pairs(found, 10)),
+            ("target_pairing", target_finder,
+             target_finder.find_best_match)):
+        time_stage(stages, stage, function, primers)
+        pairs = count_evaluated_pairs(pair_finder, function, primers)
+        seconds = stages[stage]["seconds"]
+        stages[stage]["pairs"] = pairs
+        stages[stage]["pairs_per_second"] = (pairs / seconds if seconds
+                                             else None)
+    return stages
+
+
+def git_commit():
+    """ Returns the current git commit of the repository, or None when
+    it cannot be determined.
+    """
+    try:
+        output = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                         stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode("ascii").strip()
+
+
+def run_benchmarks(sizes, gc_content, repeat_fraction, max_pcr, seed):
+    """ Benchmarks the pipeline for every template size.
+
+    Parameters:
+        sizes - The template sizes to benchmark
+        gc_content - The GC content of the templates
+        repeat_fraction - The repeated part of the templates
+        max_pcr - The maximum PCR product size
+        seed - The seed of the templates
+    Returns:
+        A dictionary with the settings, environment and results, which
+        can be dumped as JSON.
+    """
+    runs = []
+    for size in sizes:
+        template = synthetic_template(size, gc_content, repeat_fraction, seed)
+        runs.append(dict(size=size, stages=benchmark_template(
+            template, max_pcr, seed)))
+    return dict(commit=git_commit(), python=platform.python_version(),
+                platform=platform.platform(),
+                settings=dict(gc_content=gc_content,
+                              repeat_fraction=repeat_fraction,
+                              max_pcr=max_pcr, seed=seed),
+                runs=runs)
+
+
+def main(argv=None):
+    """ Runs the benchmarks from the command line and writes the
+    report as JSON.
+
+    Parameters:
+        argv - The command line arguments, sys.argv by default
+    Returns:
+        -
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmarks every stage of the primer design pipeline "
+                    "on seeded synthetic templates.")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=list(DEFAULT_SIZES),
+                        help="The template sizes, up to 10 Mb")
+    parser.add_argument("--gc", type=float, default=0.5,
+                        help="The GC content of the templates (0 to 1)")
+    parser.add_argument("--repeats", type=float, default=0.05,
+                        help="The repeated part of the templates (0 to 1)")
+    parser.add_argument("--max-pcr", type=int, default=500,
+                        help="The maximum PCR product size")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="The seed of the synthetic templates")
+    parser.add_argument("-o", "--output", default="-",
+                        help="The JSON report, standard output by default")
+    arguments = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    report = run_benchmarks(arguments.sizes, arguments.gc, arguments.repeats,
+                            arguments.max_pcr, arguments.seed)
+    if arguments.output == "-":
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        with open(arguments.output, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from PrimerCandidates import PrimerCandidates
+
+
+class CandidateStore(object):
+    """ Keeps the scanned primer windows of a single template, so a new
+    search on the same template only scans the part of the anneal range
+    which was not scanned before. Every window which passes the GC% and
+    melting temperature windows is kept by its absolute start in the
+    columns of a PrimerCandidates, including duplicates, since whether
+    a primer is a duplicate depends on the anneal range. The verdicts
+    of the single_primer_filter are kept by primer, as the rejection of
+    single_primer_rejection.
+    A store is only valid for one template, PrimerChecker configuration
+    and candidate configuration, see CandidateSession. With a
+    PrimerCache the store is saved after every search which changed it.
+    """
+
+    def __init__(self, cache=None, key=None):
+        """ Creates an empty store.
+
+        Parameters:
+            cache - Optionally a PrimerCache to save the store in
+            key - The key of this store in the cache
+        Returns:
+            -
+        """
+        self.cache = cache
+        self.key = key
+        self.changed = False
+        # The covered region, every window starting at or after start
+        # and ending at or before end is kept.
+        self.start = 0
+        self.end = 0
+        self.windows = PrimerCandidates()
+        self.verdicts = {}
+        self.last_range = None
+        self.last_primers = None
+        # The duplicates of the last anneal range, see `count_duplicates`
+        self.duplicate_range = None
+        self.duplicate_primers = None
+        self.duplicate_windows = 0
+        self.range_windows = 0
+
+    def find_all_primers(self, finder):
+        """ Finds the same primers as `AllPrimerFinder.find_all_primers`
+        would for the anneal range of the finder. Only the windows which
+        are not in the store yet are scanned, and when the anneal range
+        did not change since the last search, the last result is reused
+        without any scanning.
+
+        Parameters:
+            finder - The AllPrimerFinder to find the primers for
+        Returns:
+            The PrimerCandidates of the available primers
+        """
+        range_start = finder.anneal_minimum
+        range_end = min(finder.anneal_maximum, len(finder.sequence))
+        # Which candidates are selected also depends on their bounds
+        last_range = range_start, range_end, finder.candidate_bounds()
+        if last_range == self.last_range:
+            return self.last_primers
+        # A window never ends at the end of the anneal range
+        with finder.report.stage('enumeration'):
+            self.extend(finder, range_start, range_end - 1)
+        with finder.report.stage('single_filter'):
+            primers = self.select(finder, range_start, range_end)
+        self.last_range = last_range
+        self.last_primers = primers
+        if self.cache is not None and self.changed:
+            self.cache.save(self.key, self)
+            self.changed = False
+        return primers
+
+    def count_duplicates(self, finder, range_start, range_end):
+        """ Finds the primers which occur more than once within an anneal
+        range, which cannot be used. These only depend on the template
+        and the range, so they are kept for the last range and every
+        search on that range (like the targets of a multiplex panel)
+        shares them.
+
+        Parameters:
+            finder - The AllPrimerFinder of the template
+            range_start - The absolute start of the anneal range
+            range_end - The absolute end of the anneal range
+        Returns:
+            A set of the duplicate primers
+        """
+        if self.duplicate_range != (range_start, range_end):
+            windows = self.windows
+            starts = windows.offsets
+            lengths = windows.lengths
+            sequence = finder.sequence
+            occurrences = {}
+            total = 0
+            for index in range(bisect_left(starts, range_start),
+                               bisect_left(starts, range_end)):
+                end = starts[index] + lengths[index]
+                if end <= range_end - 1:
+                    primer = sequence[starts[index]:end]
+                    occurrences[primer] = occurrences.get(primer, 0) + 1
+                    total += 1
+            self.duplicate_primers = set(
+                primer for primer, count in occurrences.items() if count > 1)
+            self.duplicate_windows = sum(occurrences[primer] for primer
+                                         in self.duplicate_primers)
+            self.range_windows = total
+            self.duplicate_range = range_start, range_end
+        return self.duplicate_primers
+
+    def select(self, finder, range_start, range_end):
+        """ Selects the available primers of an anneal range from the
+        store, the range should be covered by the store. With candidate
+        bounds only the windows within them are looked at, the others
+        are counted as duplicate or out_of_reach, just like
+        `AllPrimerFinder.find_all_primers` would reject them.
+
+        Parameters:
+            finder - The AllPrimerFinder to select the primers for
+            range_start - The absolute start of the anneal range
+            range_end - The absolute end of the anneal range
+        Returns:
+            The PrimerCandidates of the available primers
+        """
+        windows = self.windows
+        starts = windows.offsets
+        lengths = windows.lengths
+        sequence = finder.sequence
+        report = finder.report
+        duplicates = self.count_duplicates(finder, range_start, range_end)
+        first = bisect_left(starts, range_start)
+        last = bisect_left(starts, range_end)
+        bounds = finder.candidate_bounds()
+        if bounds is None:
+            indexes = range(first, last)
+        else:
+            (forward_minimum, forward_maximum), (reverse_minimum,
+                                                 reverse_maximum) = bounds
+            # The starts of the windows of which the offset or the end
+            # can be within the bounds
+            indexes = set(range(
+                max(first, bisect_left(starts, range_start + forward_minimum)),
+                min(last, bisect_right(starts,
+                                       range_start + forward_maximum))))
+            indexes.update(range(
+                max(first, bisect_left(
+                    starts, range_start + reverse_minimum -
+                    finder.MAX_PRIMER_LENGTH + 1)),
+                min(last, bisect_right(
+                    starts, range_start + reverse_maximum -
+                    finder.MIN_PRIMER_LENGTH))))
+            indexes = sorted(indexes)
+        selected = PrimerCandidates(finder.get_annealing_sequence(),
+                                    range_start, finder.primer_checker)
+        # The windows within the range which were looked at, and of
+        # those the duplicates
+        looked_at = 0
+        looked_at_duplicates = 0
+        out_of_reach = 0
+        for index in indexes:
+            start = starts[index]
+            end = start + lengths[index]
+            if end > range_end - 1:
+                continue
+            looked_at += 1
+            primer = sequence[start:end]
+            # Duplicates cannot be used
+            if primer in duplicates:
+                looked_at_duplicates += 1
+                continue
+            if bounds is not None and not finder.within_bounds(
+                    bounds, start - range_start, lengths[index]):
+                out_of_reach += 1
+                continue
+            if primer in self.verdicts:
+                rejection = self.verdicts[primer]
+            else:
+                rejection = finder.single_primer_rejection(primer)
+                self.verdicts[primer] = rejection
+                self.changed = True
+            if rejection is None:
+                selected.append_from(windows, index, -range_start)
+            else:
+                report.reject(rejection)
+        if report.enabled:
+            # Every window which was not looked at is out of reach,
+            # unless it is a duplicate.
+            skipped_duplicates = self.duplicate_windows - looked_at_duplicates
+            for name, amount in (
+                    ('duplicate', self.duplicate_windows),
+                    ('out_of_reach', out_of_reach + self.range_windows -
+                     looked_at - skipped_duplicates)):
+                if amount:
+                    report.reject(name, amount)
+        return selected
+
+    def extend(self, finder, start, end):
+        """ Makes sure every window between start and end is in the
+        store, by scanning the region before the covered region and the
+        windows which end after it. When the region is not connected
+        to the covered region, the store starts over.
+
+        Parameters:
+            finder - The AllPrimerFinder to scan with
+            start - The absolute start of the region
+            end - The absolute end of the region (exclusive)
+        Returns:
+            -
+        """
+        if self.start <= start and end <= self.end:
+            return
+        if len(self.windows) and start <= self.end and end >= self.start:
+            new_start, new_end = min(start, self.start), max(end, self.end)
+            covered_start, covered_end = self.start, self.end
+            windows = self.windows.take(range(len(self.windows)))
+        else:
+            new_start, new_end = start, end
+            covered_start = covered_end = end
+            windows = PrimerCandidates()
+        sequence = finder.sequence
+        # Windows which start before the covered region
+        chunk = sequence[new_start:new_end]
+        scanned = finder.scan_windows(chunk, covered_start - new_start,
+                                      len(chunk) + 1)
+        for index in range(len(scanned)):
+            windows.append_from(scanned, index, new_start)
+        # Windows which start in the covered region, but end after it
+        right_start = max(covered_start,
+                          covered_end - finder.MAX_PRIMER_LENGTH)
+        chunk = sequence[right_start:new_end]
+        scanned = finder.scan_windows(
+            chunk, len(chunk) - finder.MIN_PRIMER_LENGTH + 1, len(chunk) + 1)
+        for index in range(len(scanned)):
+            if (right_start + scanned.offsets[index] +
+                    scanned.lengths[index] > covered_end):
+                windows.append_from(scanned, index, right_start)
+        self.windows = windows.take(sorted(
+            range(len(windows)),
+            key=lambda index: (windows.offsets[index],
+                               windows.lengths[index])))
+        self.start, self.end = new_start, new_end
+        self.changed = True
+
+
+class CandidateSession(object):
+    """ Keeps a CandidateStore for every combination of template,
+    PrimerChecker configuration and candidate configuration which was
+    searched in this session. Only the MAX_STORES most recently used
+    stores are kept. New stores are loaded from the PrimerCache of the
+    session when there is one.
+    """
+
+    # The maximum amount of stores kept in a session
+    MAX_STORES = 4
+
+    def __init__(self, cache=None):
+        """ Creates an empty session.
+
+        Parameters:
+            cache - Optionally a PrimerCache to load and save stores
+        Returns:
+            -
+        """
+        self.cache = cache
+        self.stores = OrderedDict()
+
+    def store_for(self, finder):
+        """ Retrieves the store for the template and settings of a
+        finder, a new store is created when there is none yet.
+
+        Parameters:
+            finder - The AllPrimerFinder to retrieve the store for
+        Returns:
+            A CandidateStore
+        """
+        key = (finder.sequence_digest(),
+               finder.primer_checker.configuration(),
+               finder.candidate_configuration())
+        store = self.stores.pop(key, None)
+        if store is None:
+            if self.cache is None:
+                store = CandidateStore()
+            else:
+                cache_key = self.cache.make_key(finder)
+                store = CandidateStore(self.cache, cache_key)
+                self.cache.load(cache_key, store)
+            while len(self.stores) >= self.MAX_STORES:
+                self.stores.popitem(last=False)
+        self.stores[key] = store
+        return store
@@ -0,0 +1,442 @@
+import argparse
+import json
+import os
+import socket
+import stat
+import sys
+import threading
+from collections import OrderedDict
+from multiprocessing import Pool, cpu_count
+from re import split
+from hashlib import sha1
+from PrimerChecker import PrimerChecker
+from PrimerFinder import NormalizedSequence
+from CandidateStore import CandidateSession
+from PrimerCache import PrimerCache
+from SearchReport import SearchReport
+from SpecificityIndex import SpecificityIndex
+from BatchDesigner import RESULT_COLUMNS, create_finder, fill_error, fill_match
+
+
+# The warm state of a worker process of the service: the normalized
+# templates, the PrimerCheckers by their settings, the SpecificityIndex
+# of the templates and the CandidateSession of the candidates.
+templates = OrderedDict()
+checkers = {}
+specificity_indexes = OrderedDict()
+session = None
+# The maximum amount of templates kept warm by a worker process
+MAX_TEMPLATES = 16
+# The integer settings a request must have, and the ones it may have
+REQUIRED_SETTINGS = ("anneal_minimum", "anneal_maximum", "max_pcr")
+OPTIONAL_SETTINGS = ("target_minimum", "target_maximum", "pairs")
+
+
+def init_worker(cache_directory):
+    """ Initialises a worker process of the service.
+
+    Parameters:
+        cache_directory - The directory of the PrimerCache or None
+    Returns:
+        -
+    """
+    global session
+    session = CandidateSession(PrimerCache(cache_directory)
+                               if cache_directory else None)
+    session.MAX_STORES = MAX_TEMPLATES
+
+
+def remember(cache, key, value):
+    """ Adds a value to a least recently used cache of MAX_TEMPLATES
+    entries.
+    """
+    while len(cache) >= MAX_TEMPLATES:
+        cache.popitem(last=False)
+    cache[key] = value
+    return value
+
+
+def get_template(sequence):
+    """ Retrieves the normalized template of a sequence, which is
+    normalized and hashed once per worker process.
+
+    Parameters:
+        sequence - The sequence of a request
+    Returns:
+        A NormalizedSequence with its digest
+    """
+    template = templates.pop(sequence, None)
+    if template is None:
+        template = NormalizedSequence("".join(split(r"\s+",
+                                                    sequence.upper())))
+        template.digest = sha1(template.encode("ascii")).hexdigest()
+    return remember(templates, sequence, template)
+
+
+def get_checker(checker_settings):
+    """ Retrieves the PrimerChecker of the checker settings of a
+    request, every worker process keeps one per settings so their
+    caches stay warm.
+
+    Parameters:
+        checker_settings - The keyword arguments for the PrimerChecker
+    Returns:
+        A PrimerChecker
+    """
+    key = json.dumps(checker_settings, sort_keys=True)
+    if key not in checkers:
+        checkers[key] = PrimerChecker(**checker_settings)
+    return checkers[key]
+
+
+def get_specificity_index(template, specificity_settings):
+    """ Retrieves the SpecificityIndex of a template and settings. """
+    key = template.digest, json.dumps(specificity_settings, sort_keys=True)
+    index = specificity_indexes.pop(key, None)
+    if index is None:
+        index = SpecificityIndex(template, **specificity_settings)
+    return remember(specificity_indexes, key, index)
+
+
+def validate_request(request):
+    """ Checks a request before it is sent to a worker: it should be a
+    JSON object with a string sequence and the integer settings of
+    REQUIRED_SETTINGS, and the ones of OPTIONAL_SETTINGS which it has
+    should be integers as well.
+
+    Parameters:
+        request - The decoded request
+    Returns:
+        -
+    Raises:
+        ValueError - When the request is not valid
+    """
+    if not isinstance(request, dict):
+        raise ValueError("A request should be a JSON object")
+    if not isinstance(request.get("sequence"), (type(""), type(u""))):
+        raise ValueError("The sequence of a request should be a string")
+    for key in REQUIRED_SETTINGS + OPTIONAL_SETTINGS:
+        if key not in request and key in OPTIONAL_SETTINGS:
+            continue
+        try:
+            int(request[key])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("The {} of a request should be an "
+                             "integer".format(key))
+
+
+def create_result(request, error=None):
+    """ Creates the result of a request, with the RESULT_COLUMNS and the
+    id and name of the request, or of another result.
+
+    Parameters:
+        request - The request or result dictionary
+        error - The exception which made the request fail, or None
+    Returns:
+        The result dictionary
+    """
+    result = dict.fromkeys(RESULT_COLUMNS, "")
+    result["id"] = request.get("id")
+    result["name"] = request.get("name", "")
+    if error is not None:
+        fill_error(result, error)
+    return result
+
+
+def encode_result(result):
+    """ Encodes a result as a JSON line. A result which cannot be
+    encoded is answered with an error instead, with its id and name
+    when those can be encoded.
+
+    Parameters:
+        result - The result dictionary
+    Returns:
+        The JSON line without the line end
+    """
+    try:
+        return json.dumps(result, sort_keys=True)
+    except (TypeError, ValueError) as error:
+        result = create_result(result, error)
+    try:
+        return json.dumps(result, sort_keys=True)
+    except (TypeError, ValueError):
+        result["id"] = None
+        result["name"] = ""
+        return json.dumps(result, sort_keys=True)
+
+
+def design_request(request):
+    """ Designs the primers of a single request. This is the function
+    which runs in the worker processes. A request is a dictionary with
+    the sequence and the settings of `BatchDesigner.create_finder`,
+    and optionally an id and name which are returned as is, the
+    checker settings (keyword arguments of the PrimerChecker), the
+    specificity settings (keyword arguments of the SpecificityIndex),
+    report (true to add the SearchReport) and pairs (an amount of
+    ranked pairs to add).
+
+    Parameters:
+        request - The request dictionary
+    Returns:
+        A dictionary with the RESULT_COLUMNS and the id as keys, the
+        status is error with an error message when the request failed.
+    """
+    result = create_result(request)
+    try:
+        template = get_template(request["sequence"])
+        settings = dict((key, int(request[key]))
+                        for key in REQUIRED_SETTINGS)
+        if "target_minimum" in request and "target_maximum" in request:
+            settings["target_minimum"] = int(request["target_minimum"])
+            settings["target_maximum"] = int(request["target_maximum"])
+        finder = create_finder(get_checker(request.get("checker", {})),
+                               template, settings)
+        if request.get("specificity") is not None:
+            finder.specificity_index = get_specificity_index(
+                template, request["specificity"])
+        finder.candidate_store = session.store_for(finder)
+        finder.report = SearchReport(bool(request.get("report")))
+        if request.get("pairs"):
+            matches = finder.find_ranked_pairs(int(request["pairs"]))
+            result["pairs"] = []
+            for match in matches:
+                pair = {}
+                fill_match(pair, match)
+                del pair["status"]
+                result["pairs"].append(pair)
+            match = matches[0] if matches else None
+        else:
+            match = finder.find_primers()
+        if finder.report.enabled:
+            result["report"] = finder.report.as_dict()
+    except Exception as error:
+        fill_error(result, error)
+        return result
+    if not match:
+        result["status"] = "no primers found"
+        return result
+    fill_match(result, match)
+    return result
+
+
+class DesignService(object):
+    """ A long running service which designs primers for JSON lines
+    requests, see `design_request`. The requests of a client are read
+    one line at a time and answered with a JSON line as soon as they
+    are designed, so the answers can come in another order than the
+    requests; the id of a request identifies its answer.
+    The searches run in worker processes, which each keep their
+    templates, PrimerCheckers and candidates warm between requests.
+    Requests on the same template go to the same worker, so its
+    candidates are scanned once, unless that worker is busy while
+    another is idle. Every client is served by a thread of its own, so
+    clients only wait for each other when every worker is busy.
+    """
+
+    def __init__(self, processes=None, cache_directory=None):
+        """ Starts the worker processes.
+
+        Parameters:
+            processes - The amount of worker processes, the amount of
+            cores by default.
+            cache_directory - The directory of a PrimerCache which the
+            workers load and save their candidates in, or None.
+        Returns:
+            -
+        """
+        self.pools = [Pool(1, init_worker, (cache_directory,))
+                      for _ in range(processes or cpu_count())]
+        # The amount of pending requests of every worker
+        self.loads = [0] * len(self.pools)
+        self.lock = threading.Lock()
+
+    def submit(self, request, callback):
+        """ Sends a request to the worker of its template. A request
+        which fails in the pool, for instance because its result cannot
+        be sent back, is answered with an error.
+
+        Parameters:
+            request - A valid request dictionary, see `validate_request`
+            callback - Called with the result in a thread of the pool
+        Returns:
+            -
+        """
+        with self.lock:
+            worker = hash(request["sequence"]) % len(self.pools)
+            if self.loads[worker] and 0 in self.loads:
+                worker = self.loads.index(0)
+            self.loads[worker] += 1
+
+        def finish(result):
+            with self.lock:
+                self.loads[worker] -= 1
+            callback(result)
+
+        def fail(error):
+            finish(create_result(request, error))
+        callbacks = dict(callback=finish)
+        # Python 2 has no error callback, there design_request catches
+        # the errors of a valid request itself
+        if sys.version_info[0] > 2:
+            callbacks["error_callback"] = fail
+        self.pools[worker].apply_async(design_request, (request,),
+                                       **callbacks)
+
+    def serve(self, reader, writer):
+        """ Serves a single client until it closes its requests. This
+        returns once every request is answered.
+
+        Parameters:
+            reader - An opened file with the JSON lines requests
+            writer - An opened file to write the answers to
+        Returns:
+            The amount of answered requests
+        """
+        condition = threading.Condition()
+        # The amount of pending and answered requests
+        counts = [0, 0]
+
+        def answer(result):
+            with condition:
+                try:
+                    writer.write(encode_result(result) + "\n")
+                    writer.flush()
+                except (IOError, OSError, ValueError):
+                    # The client is gone, the other answers are dropped
+                    pass
+                finally:
+                    counts[0] -= 1
+                    counts[1] += 1
+                    condition.notify_all()
+
+        for line in iter(reader.readline, ""):
+            line = line.strip()
+            if not line:
+                continue
+            with condition:
+                counts[0] += 1
+            request = None
+            try:
+                request = json.loads(line)
+                validate_request(request)
+            except ValueError as error:
+                answer(create_result(request if isinstance(request, dict)
+                                     else {}, error))
+                continue
+            self.submit(request, answer)
+        with condition:
+            while counts[0]:
+                condition.wait()
+        return counts[1]
+
+    def serve_connection(self, connection):
+        """ Serves a client of a socket, see `serve`. """
+        try:
+            self.serve(connection.makefile("r"), connection.makefile("w"))
+        except (IOError, OSError):
+            pass
+        finally:
+            connection.close()
+
+    def serve_socket(self, server):
+        """ Accepts the clients of a listening socket forever, every
+        client is served in a thread of its own.
+
+        Parameters:
+            server - The listening socket
+        Returns:
+            -
+        """
+        while True:
+            connection, _ = server.accept()
+            client = threading.Thread(target=self.serve_connection,
+                                      args=(connection,))
+            client.daemon = True
+            client.start()
+
+    def close(self):
+        """ Stops the worker processes once they are done. """
+        for pool in self.pools:
+            pool.close()
+        for pool in self.pools:
+            pool.join()
+
+
+def open_socket(arguments):
+    """ Opens the listening socket of the command line arguments, a
+    unix socket at a path or a TCP socket on the local host.
+
+    Parameters:
+        arguments - The parsed arguments
+    Returns:
+        The listening socket
+    """
+    if arguments.socket:
+        # Only a socket left behind by an earlier run is replaced
+        if (os.path.exists(arguments.socket) and
+                stat.S_ISSOCK(os.stat(arguments.socket).st_mode)):
+            os.remove(arguments.socket)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(arguments.socket)
+    else:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(("127.0.0.1", arguments.port))
+    server.listen(16)
+    return server
+
+
+def parse_arguments(argv):
+    """ Parses the command line arguments of the service.
+
+    Parameters:
+        argv - The command line arguments without the program name
+    Returns:
+        The parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Designs primers for JSON lines requests as a long "
+                    "running local service, on standard input and output "
+                    "by default.")
+    transport = parser.add_mutually_exclusive_group()
+    transport.add_argument("--socket", default=None,
+                           help="Listens on a unix socket at this path")
+    transport.add_argument("--port", type=int, default=None,
+                           help="Listens on this TCP port of the local host")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="The amount of worker processes, the amount of "
+                             "cores by default")
+    parser.add_argument("--cache", default=None,
+                        help="Directory of a persistent cache of the primer "
+                             "candidates of every template")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """ Runs the service until standard input is closed, or until it
+    is interrupted when it listens on a socket.
+
+    Parameters:
+        argv - The command line arguments, sys.argv by default
+    Returns:
+        -
+    """
+    arguments = parse_arguments(sys.argv[1:] if argv is None else argv)
+    service = DesignService(arguments.processes, arguments.cache)
+    try:
+        if arguments.socket or arguments.port is not None:
+            server = open_socket(arguments)
+            try:
+                service.serve_socket(server)
+            finally:
+                server.close()
+        else:
+            service.serve(sys.stdin, sys.stdout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import mmap
+import os
+
+
+class FastaFile(object):
+    """ A FASTA file which is memory mapped instead of read, so even
+    chromosome scale templates can be used. The records are found with
+    an index in the .fai format (the samtools faidx format), which is
+    read from <path>.fai when it exists and otherwise built by scanning
+    the file once. Every record can be retrieved as a FastaSequence,
+    which only reads the windows which are requested from it.
+    """
+
+    def __init__(self, path, write_index=False):
+        """ Opens and memory maps the FASTA file and loads its index.
+
+        Parameters:
+            path - The path of the FASTA file
+            write_index - Whether to write a built index to <path>.fai,
+            so it can be reused next time.
+        Returns:
+            -
+        """
+        self.path = path
+        self.handle = open(path, "rb")
+        self.data = mmap.mmap(self.handle.fileno(), 0,
+                              access=mmap.ACCESS_READ)
+        index_path = path + ".fai"
+        if os.path.exists(index_path):
+            self.index = self.read_index(index_path)
+        else:
+            self.index = self.build_index()
+            if write_index:
+                self.write_index(index_path)
+        self.records = dict((entry[0], entry) for entry in self.index)
+
+    def read_index(self, index_path):
+        """ Reads a .fai index file.
+
+        Parameters:
+            index_path - The path of the index
+        Returns:
+            A list of (name, length, offset, line_bases, line_width)
+            tuples in order of the file.
+        """
+        index = []
+        with open(index_path) as index_file:
+            for line in index_file:
+                fields = line.rstrip("\n").split("\t")
+                index.append((fields[0],) +
+                             tuple(int(field) for field in fields[1:5]))
+        return index
+
+    def build_index(self):
+        """ Builds the index by scanning the lines of the file once.
+        The lines of a record need to have equal lengths, except for
+        the last one, otherwise the position of a nucleotide cannot be
+        calculated.
+
+        Parameters:
+            -
+        Returns:
+            A list of (name, length, offset, line_bases, line_width)
+            tuples in order of the file.
+        """
+        index = []
+        record = None
+        position = 0
+        for line in iter(self.data.readline, b""):
+            if line.startswith(b">"):
+                if record is not None:
+                    index.append(tuple(record))
+                name = (line[1:].split() or [b""])[0].decode("ascii")
+                record = [name, 0, position + len(line), 0, 0, False]
+            elif record is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if bases:
+                    if record[5]:
+                        raise ValueError("Different line lengths in record "
+                                         "{}".format(record[0]))
+                    if not record[3]:
+                        record[3], record[4] = bases, len(line)
+                    elif bases > record[3]:
+                        raise ValueError("Different line lengths in record "
+                                         "{}".format(record[0]))
+                    elif bases < record[3]:
+                        # Only the last line may be shorter
+                        record[5] = True
+                    record[1] += bases
+            position += len(line)
+        if record is not None:
+            index.append(tuple(record))
+        self.data.seek(0)
+        return [entry[:5] for entry in index]
+
+    def write_index(self, index_path):
+        """ Writes the index as a .fai file.
+
+        Parameters:
+            index_path - The path to write the index to
+        Returns:
+            -
+        """
+        with open(index_path, "w") as index_file:
+            for entry in self.index:
+                index_file.write("\t".join(str(field) for field in entry) +
+                                 "\n")
+
+    def names(self):
+        """ Returns the names of the records in order of the file. """
+        return [entry[0] for entry in self.index]
+
+    def __getitem__(self, name):
+        """ Retrieves a record by its name.
+
+        Parameters:
+            name - The name of the record, the first word of its header
+        Returns:
+            A FastaSequence of the record
+        """
+        return FastaSequence(self.data, *self.records[name][1:])
+
+    def close(self):
+        """ Closes the memory map and the file. """
+        self.data.close()
+        self.handle.close()
+
+
+class FastaSequence(object):
+    """ A single record of a memory mapped FASTA file. It behaves like
+    an (already normalized) sequence string for slicing, a slice only
+    reads the lines of that window and removes the line endings and
+    converts it to upper case on the fly. This way memory usage follows
+    the size of the windows rather than the size of the record.
+    """
+
+    def __init__(self, data, length, offset, line_bases, line_width):
+        """ Creates the sequence from an entry of the index.
+
+        Parameters:
+            data - The memory map of the FASTA file
+            length - The amount of nucleotides in the record
+            offset - The byte offset of the first nucleotide
+            line_bases - The amount of nucleotides on a line
+            line_width - The amount of bytes of a line, including the
+            line ending
+        Returns:
+            -
+        """
+        self.data = data
+        self.length = length
+        self.offset = offset
+        self.line_bases = line_bases
+        self.line_width = line_width
+
+    def byte_position(self, position):
+        """ Calculates the byte offset of a nucleotide in the file. """
+        lines, column = divmod(position, self.line_bases)
+        return self.offset + lines * self.line_width + column
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        """ Retrieves a window (or a single nucleotide) of the sequence.
+
+        Parameters:
+            key - A slice without a step or an integer
+        Returns:
+            The normalized window as a string
+        """
+        if not isinstance(key, slice):
+            if key < 0:
+                key += self.length
+            if not 0 <= key < self.length:
+                raise IndexError("sequence index out of range")
+            return self[key:key + 1]
+        start, stop, step = key.indices(self.length)
+        if step != 1:
+            raise ValueError("FastaSequence slices cannot have a step")
+        if stop <= start:
+            return ""
+        window = self.data[self.byte_position(start):
+                           self.byte_position(stop - 1) + 1]
+        return (window.replace(b"\n", b"").replace(b"\r", b"")
+                .decode("ascii").upper())
@@ -1,8 +1,15 @@
+import threading
+import time
+import traceback
 import wx
-from InputPanel import InputPanel
+from InputPanel import InputPanel, event_wrapper
 from ShowPanel import ShowPanel
 from AllPrimerFinder import AllPrimerFinder
 from TargetPrimerFinder import TargetPrimerFinder
+from PrimerFinder import SearchCancelled
+from CandidateStore import CandidateSession
+from SearchReport import SearchReport
+from SpecificityIndex import SpecificityIndex
 
 
 class Frame(wx.Frame):
@@ -10,8 +17,18 @@ class Frame(wx.Frame):
     result dialogs. This is the main class which handles the hiding and
     showing of panels. As a result of this, it handles the buttons of
     the panels which should do this.
+    A search finds the best primer pair, or up to RESULT_LIMIT ranked
+    primer pairs when ranking is checked, which are shown in the
+    ShowPanel. Searches run in a worker thread, so the settings stay
+    usable while searching. The worker only talks to the widgets
+    through wx.CallAfter.
     """
 
+    # The maximum amount of ranked primer pairs shown of a search
+    RESULT_LIMIT = 1000
+    # The minimum seconds between two shown progress reports
+    PROGRESS_INTERVAL = 0.1
+
     def __init__(self, parent, id, title):
         """ Creates the inputpanel, resultpanel and binds events to
         the widgets of those panels.
@@ -30,9 +47,22 @@ class Frame(wx.Frame):
         self.input_panel = InputPanel(self, wx.ID_ANY)
         self.input_panel.primers_button.Bind(wx.EVT_BUTTON,
                                              self.handle_primer_button)
-        self.show_panel = 0
+        self.input_panel.cancel_button.Bind(wx.EVT_BUTTON,
+                                            self.handle_cancel_button)
+        self.show_panel = ShowPanel(self, wx.ID_ANY)
+        self.show_panel.return_button.Bind(wx.EVT_BUTTON, self.handle_return)
+        self.finder = None
+        self.search_start = 0
+        # The time the last progress report was shown
+        self.progress_shown = 0
+        # Reuses the candidates of earlier searches on the same template
+        self.candidate_session = CandidateSession()
+        # The SpecificityIndex of the last template and its digest
+        self.specificity_index = None
+        self.specificity_digest = None
         self.wrapper_box = wx.BoxSizer(wx.VERTICAL)
         self.wrapper_box.Add(self.input_panel, 1, wx.EXPAND)
+        self.wrapper_box.Add(self.show_panel, 1, wx.EXPAND)
         self.SetSizer(self.wrapper_box)
         self.Centre()
         self.Show(True)
@@ -48,10 +78,15 @@ class Frame(wx.Frame):
         collect all the arguments required for AllPrimerFinder and
         TargetPrimerFinder and will create the correct object according
         to the use_target checkbox; this checkbox defines whether to
-        use the target range or not.
+        use the target range or not. The search itself is started in a
+        worker thread, see `run_search`. Candidates of earlier searches
+        on the same template and checks are reused.
         """
-        arguments = [self.input_panel.create_primer_checker()]
-        for field in ('dna_field', 'anneal_range_minimum',
+        if self.finder is not None:
+            return
+        arguments = [self.input_panel.create_primer_checker(),
+                     self.input_panel.get_sequence()]
+        for field in ('anneal_range_minimum',
                       'anneal_range_maximum', 'max_pcr',
                       'target_range_minimum', 'target_range_maximum'):
             arguments.append(getattr(self.input_panel, field).GetValue())
@@ -60,20 +95,141 @@ class Frame(wx.Frame):
         else:
             arguments = arguments[:-2]
             finder = AllPrimerFinder(*arguments)
-        self.create_show_panel()
-        self.show_panel.set_primer(finder.find_primers())
+        finder.report = SearchReport(self.input_panel.report_check.GetValue())
+        finder.progress_callback = event_wrapper(self.show_progress, finder)
+        self.finder = finder
+        self.search_start = time.time()
+        self.progress_shown = 0
+        self.input_panel.primers_button.Disable()
+        self.input_panel.cancel_button.Enable()
+        self.input_panel.progress_text.SetLabel("Searching...")
+        worker = threading.Thread(
+            target=self.run_search,
+            args=(finder, self.input_panel.specificity_check.GetValue(),
+                  self.input_panel.rank_check.GetValue()))
+        worker.daemon = True
+        worker.start()
+
+    def handle_cancel_button(self, event):
+        """ Cancels the running search, the worker stops at its next
+        progress report.
+        """
+        if self.finder is not None:
+            self.finder.cancel()
+
+    def run_search(self, finder, check_specificity, rank):
+        """ Runs the search of a finder, this is done in the worker
+        thread. The result is handed to `finish_search` on the main
+        thread, see `AllPrimerFinder.find_pair_results`. Without rank
+        the search stops at the best match. A search which
+        fails hands over its exception instead, of which the traceback
+        is printed here since it is lost with the thread otherwise.
+
+        Parameters:
+            finder - The PrimerFinder to search with
+            check_specificity - Whether to reject off-target primers
+            rank - Whether to rank up to RESULT_LIMIT primer pairs
+        Returns:
+            -
+        """
+        results = None
+        cancelled = False
+        error = None
+        try:
+            if check_specificity:
+                finder.specificity_index = self.get_specificity_index(finder)
+            finder.candidate_store = self.candidate_session.store_for(finder)
+            results = finder.find_pair_results(self.RESULT_LIMIT if rank
+                                                else None)
+        except SearchCancelled:
+            cancelled = True
+        except Exception as exception:
+            traceback.print_exc()
+            error = exception
+        finally:
+            wx.CallAfter(self.finish_search, finder, results, cancelled,
+                         error)
+
+    def get_specificity_index(self, finder):
+        """ Retrieves the SpecificityIndex of the template of a finder,
+        the index of the last template is reused when it did not
+        change.
+
+        Parameters:
+            finder - The finder to retrieve the index for
+        Returns:
+            A SpecificityIndex
+        """
+        digest = finder.sequence_digest()
+        if digest != self.specificity_digest:
+            self.specificity_index = SpecificityIndex(finder.sequence)
+            self.specificity_digest = digest
+        return self.specificity_index
+
+    def show_progress(self, counters, finder):
+        """ Shows the progress of a search, this is called from the
+        worker thread so the widgets are updated through wx.CallAfter.
+        A search reports its progress very often, so a report is only
+        shown when the last one was shown at least PROGRESS_INTERVAL
+        seconds ago.
+
+        Parameters:
+            counters - The progress counters of the finder
+            finder - The finder which reports the progress
+        Returns:
+            -
+        """
+        now = time.time()
+        if now - self.progress_shown < self.PROGRESS_INTERVAL:
+            return
+        self.progress_shown = now
+        wx.CallAfter(self.set_progress_text, finder,
+                     "Scanned {candidates} candidates, filtered {filtered}, "
+                     "evaluated {pairs} pairs ({elapsed:.1f}s)".format(
+                         elapsed=now - self.search_start, **counters))
+
+    def set_progress_text(self, finder, text):
+        """ Sets the progress text when the finder is still the running
+        search, late reports of an old search are ignored.
+        """
+        if finder is self.finder:
+            self.input_panel.progress_text.SetLabel(text)
+
+    def finish_search(self, finder, results, cancelled, error=None):
+        """ Shows the result of a finished search and enables the
+        Search primers button again. A failed search is shown in a
+        message box, the settings stay on screen.
+
+        Parameters:
+            finder - The finder of the finished search
+            results - The PairResults of the search or None
+            cancelled - Whether the search was cancelled
+            error - The exception of a failed search, or None
+        Returns:
+            -
+        """
+        self.finder = None
+        self.input_panel.primers_button.Enable()
+        self.input_panel.cancel_button.Disable()
+        if cancelled:
+            self.input_panel.progress_text.SetLabel("Search cancelled")
+            return
+        if error is not None:
+            self.input_panel.progress_text.SetLabel("Search failed")
+            wx.MessageBox("The search failed: {}: {}".format(
+                type(error).__name__, error), "Search failed",
+                wx.OK | wx.ICON_ERROR, self)
+            return
+        self.input_panel.progress_text.SetLabel(
+            "Search took {:.1f}s".format(time.time() - self.search_start))
+        self.show_panel.set_results(results)
+        self.show_panel.set_report(finder.report if finder.report.enabled
+                                   else None)
         self.input_panel.Hide()
         self.SetSize((1118, 313))
         self.show_panel.Show()
         self.Layout()
 
-    def create_show_panel(self):
-        if self.show_panel:
-            self.wrapper_box.Remove(self.show_panel)
-        self.show_panel = ShowPanel(self, wx.ID_ANY)
-        self.show_panel.return_button.Bind(wx.EVT_BUTTON, self.handle_return)
-        self.wrapper_box.Add(self.show_panel, 1, wx.EXPAND)
-
 
 if __name__ == '__main__':
     # Start the app regularly
@@ -0,0 +1,267 @@
+from math import log
+from NearestNeighbor import NearestNeighbor
+
+
+INFINITY = float('inf')
+
+
+class FreeEnergy(object):
+    """ Calculates the Gibbs free energy (at 37 degrees Celsius, in
+    kcal/mol) of the most stable dimer of two primers and of the most
+    stable hairpin of a primer, with the nearest-neighbor stacks of
+    SantaLucia (1998).
+    Both are found with a dynamic programming table over the
+    nucleotides of the one strand (rows) and the other strand, read
+    3' to 5' (columns). A cell holds the free energy of the most stable
+    helix which ends with that pair, which continues a helix through a
+    stack, a 1x1 or 2x2 internal loop or a single bulge. The loops
+    use the loop initiation energies of SantaLucia & Hicks (2004)
+    without the sequence dependent terms, which is an approximation.
+    A primer is prepared once with `prepare`, after which its rows are
+    reused for every primer it is checked against. The results are
+    cached per (pair of) primer(s). When only a threshold matters, most
+    pairs are ruled out by `duplex_bound` without filling the table.
+    """
+
+    complement_dict = dict(A='T', T='A', C='G', G='C')
+    # The one-hot bit of every dinucleotide in `encode`
+    dinucleotide_bits = dict((first + second, 1 << (4 * i + j))
+                             for i, first in enumerate('ACGT')
+                             for j, second in enumerate('ACGT'))
+    # The temperature of the free energies in Kelvin
+    TEMPERATURE = 310.15
+    # The initiation of a dimer
+    INITIATION = 1.96
+    # The 1x1 and 2x2 internal loops, by unpaired nucleotides per strand
+    INTERNAL_LOOPS = (0.5, 1.1)
+    # A single unpaired nucleotide on either strand
+    BULGE = 4.0
+    # The hairpin loops by length, longer loops are extrapolated
+    HAIRPIN_LOOPS = {3: 3.5, 4: 3.5, 5: 3.3, 6: 4.0, 7: 4.2, 8: 4.3, 9: 4.5,
+                     10: 4.6}
+    MIN_HAIRPIN_LOOP = 3
+    # The maximum amount of cached results
+    CACHE_SIZE = 100000
+
+    def __init__(self):
+        """ Calculates the free energy of every stack at TEMPERATURE.
+
+        Parameters:
+            -
+        Returns:
+            -
+        """
+        # The stacks of NearestNeighbor are in tenths of their units
+        self.stack_energies = dict(
+            (stack, (enthalpy - self.TEMPERATURE * entropy / 1000.0) / 10)
+            for stack, (enthalpy, entropy) in NearestNeighbor.stacks.items())
+        self._duplexes = {}
+        self._hairpins = {}
+        self._encodings = {}
+
+    def hairpin_loop(self, length):
+        """ Returns the free energy of a hairpin loop of a length. """
+        if length in self.HAIRPIN_LOOPS:
+            return self.HAIRPIN_LOOPS[length]
+        # The extrapolation of SantaLucia & Hicks (2004)
+        return self.HAIRPIN_LOOPS[10] + (
+            2.44 * 1.987 * self.TEMPERATURE / 1000.0 * log(length / 10.0))
+
+    def encode(self, sequence):
+        """ Encodes the dinucleotides of a sequence as an integer
+        bitmask with 16 bits per position, of which the bit of the
+        dinucleotide starting at that position is set (one-hot).
+        Dinucleotides with an unknown nucleotide have no bit set. The
+        encodings are cached, since primers are paired with many
+        others.
+        """
+        mask = self._encodings.get(sequence)
+        if mask is None:
+            if len(self._encodings) >= self.CACHE_SIZE:
+                self._encodings.clear()
+            mask = 0
+            for i in range(len(sequence) - 1):
+                mask |= self.dinucleotide_bits.get(sequence[i:i + 2],
+                                                   0) << (16 * i)
+            self._encodings[sequence] = mask
+        return mask
+
+    def prepare(self, primer):
+        """ Prepares a primer for the rows of the table: the complement
+        and the stack with the previous nucleotide of every nucleotide,
+        along with the rows which are reused for every calculation.
+
+        Parameters:
+            primer - The primer (5' to 3')
+        Returns:
+            A tuple of the primer, the complements, the stacks, the rows
+            and the encoding of the complements along with the stack of
+            every bit of it.
+        """
+        complements = [self.complement_dict.get(nucleotide)
+                       for nucleotide in primer]
+        stacks = [0.0] + [self.stack_energies.get(primer[i - 1:i + 1],
+                                                  INFINITY)
+                          for i in range(1, len(primer))]
+        paired = "".join(complement or ' ' for complement in complements)
+        mask = self.encode(paired)
+        # The stack which starts at the nucleotide of a bit
+        bit_stacks = {}
+        for i in range(len(primer) - 1):
+            bit = self.dinucleotide_bits.get(paired[i:i + 2])
+            if bit is not None:
+                bit_stacks[bit << (16 * i)] = stacks[i + 1]
+        rows = [[], [], [], []]
+        return primer, complements, stacks, rows, (mask, bit_stacks)
+
+    def duplex_bound(self, prepared, other):
+        """ Calculates a lower bound of the free energy of the duplexes
+        of a prepared primer and the other strand. Every stack of a
+        duplex lies on a diagonal of the table and every bulge moves the
+        duplex to a neighbouring diagonal, so a duplex with b bulges
+        lies on a range of at most b + 1 neighbouring diagonals and has
+        at most the stacks of those diagonals. The stacks of every
+        diagonal are found at once with the dinucleotide bitmasks of the
+        strands, like `PrimerChecker.is_dimer` finds bonds.
+
+        Parameters:
+            prepared - The primer of the rows, from `prepare`
+            other - The other strand read 3' to 5'
+        Returns:
+            A free energy which no duplex of the strands goes below
+        """
+        primer, (mask, bit_stacks) = prepared[0], prepared[4]
+        other_mask = self.encode(other)
+        bulge = self.BULGE
+        # The lowest energy of a range of diagonals ending at the
+        # current diagonal, with a bulge for every diagonal
+        energy = bound = 0.0
+        for shift in range(2 - len(primer), len(other) - 1):
+            if shift >= 0:
+                stacks = mask & (other_mask >> (16 * shift))
+            else:
+                stacks = mask & (other_mask << (-16 * shift))
+            if energy > 0.0:
+                energy = 0.0
+            energy += bulge
+            while stacks:
+                bit = stacks & -stacks
+                energy += bit_stacks[bit]
+                stacks ^= bit
+            if energy < bound:
+                bound = energy
+        # The first diagonal of a range has no bulge
+        if bound < bulge:
+            return self.INITIATION + bound - bulge
+        return self.INITIATION
+
+    def fold(self, prepared, other, hairpin=False):
+        """ Fills the table of a prepared primer and the other strand
+        and returns the free energy of the most stable structure.
+
+        Parameters:
+            prepared - The primer of the rows, from `prepare`
+            other - The other strand read 3' to 5', so the nucleotides
+            of the columns pair with the rows antiparallel.
+            hairpin - Whether the other strand is the primer itself, in
+            which case only pairs which close a hairpin loop count.
+        Returns:
+            The lowest free energy, INITIATION or higher when there is
+            no helix at all.
+        """
+        primer, complements, stacks, rows, _ = prepared
+        length = len(other)
+        for row in rows:
+            row[:] = [INFINITY] * length
+        previous_3, previous_2, previous_1, current = rows
+        internal_1, internal_2 = self.INTERNAL_LOOPS
+        bulge = self.BULGE
+        best = INFINITY
+        for i in range(len(primer)):
+            complement = complements[i]
+            stack = stacks[i]
+            # The columns which can pair with this row
+            end = (len(primer) - i - 1 - self.MIN_HAIRPIN_LOOP if hairpin
+                   else length)
+            for j in range(length):
+                if j >= end or other[j] != complement:
+                    current[j] = INFINITY
+                    continue
+                energy = 0.0
+                if j:
+                    energy = min(energy, previous_1[j - 1] + stack)
+                    if j > 1:
+                        energy = min(energy, previous_2[j - 2] + internal_1,
+                                     previous_2[j - 1] + bulge,
+                                     previous_1[j - 2] + bulge)
+                        if j > 2:
+                            energy = min(energy,
+                                         previous_3[j - 3] + internal_2)
+                current[j] = energy
+                if hairpin:
+                    energy += self.hairpin_loop(len(primer) - i - j - 2)
+                else:
+                    energy += self.INITIATION
+                if energy < best:
+                    best = energy
+            previous_3, previous_2, previous_1, current = (
+                previous_2, previous_1, current, previous_3)
+        return best
+
+    def duplex_delta_g(self, primer_a, primer_b, prepared=None,
+                       limit=None):
+        """ Calculates the free energy of the most stable dimer of two
+        primers.
+
+        Parameters:
+            primer_a - The first primer (5' to 3')
+            primer_b - The second primer (5' to 3')
+            prepared - Optionally primer_a prepared with `prepare`
+            limit - Optionally the free energy of interest, when no
+            duplex can reach it the bound of `duplex_bound` is returned
+            instead of the exact free energy.
+        Returns:
+            The free energy in kcal/mol
+        """
+        key = primer_a, primer_b
+        delta_g = self._duplexes.get(key)
+        if delta_g is None:
+            if prepared is None:
+                prepared = self.prepare(primer_a)
+            other = primer_b[::-1]
+            if limit is not None:
+                bound = self.duplex_bound(prepared, other)
+                if bound > limit:
+                    return bound
+            if len(self._duplexes) >= self.CACHE_SIZE:
+                self._duplexes.clear()
+            delta_g = self.fold(prepared, other)
+            self._duplexes[key] = delta_g
+        return delta_g
+
+    def hairpin_delta_g(self, primer):
+        """ Calculates the free energy of the most stable hairpin of a
+        primer.
+
+        Parameters:
+            primer - The primer (5' to 3')
+        Returns:
+            The free energy in kcal/mol, infinite when no hairpin fits
+        """
+        delta_g = self._hairpins.get(primer)
+        if delta_g is None:
+            if len(self._hairpins) >= self.CACHE_SIZE:
+                self._hairpins.clear()
+            delta_g = self.fold(self.prepare(primer), primer[::-1], True)
+            self._hairpins[primer] = delta_g
+        return delta_g
+
+    def __getstate__(self):
+        """ Creates the state to pickle this object with, the caches are
+        left out since they are only useful within this process.
+        """
+        state = dict(self.__dict__)
+        state['_duplexes'] = {}
+        state['_hairpins'] = {}
+        state['_encodings'] = {}
+        return state
@@ -1,4 +1,5 @@
 from PrimerChecker import PrimerChecker
+import threading
 import wx
 import re
 
@@ -35,6 +36,16 @@ class InputPanel(wx.Panel):
 
     # The default spinner style
     SPINNER_STYLE = (wx.SP_HORIZONTAL | wx.SP_ARROW_KEYS | wx.SP_WRAP)
+    # The characters which are removed from the sequence
+    INVALID_NUCLEOTIDES = re.compile("[^atcgnxATCGNX]")
+    # The milliseconds after the last edit before the sequence is checked
+    CHECK_DELAY = 300
+    # Pastes longer than this are normalized in a worker thread, and
+    # longer sequences are not shown in the DNA input field
+    LARGE_PASTE = 100000
+    # The characters normalized at once, a worker thread hands the
+    # interpreter back to the main loop between the chunks
+    NORMALIZE_CHUNK = 1000000
 
     def __init__(self, parent, id):
         """ Creates the main Sizer container and calls
@@ -50,6 +61,15 @@ class InputPanel(wx.Panel):
         """
         super(InputPanel, self).__init__(parent, id)
         self.skip_additional = False
+        # A pasted sequence which is too long to show, or None
+        self.pasted_sequence = None
+        # The span of the DNA input field edited since the last check
+        self.pending_span = None
+        self.text_length = 0
+        self.replacing = False
+        # The number of the last paste, earlier pastes are ignored
+        self.paste_count = 0
+        self.check_timer = wx.Timer(self)
         required_input = wx.BoxSizer(wx.HORIZONTAL)
         required_input.Add(self.create_dna_input(), 1, wx.EXPAND)
         required_input.Add(self.create_settings_box(), 1, wx.EXPAND | wx.LEFT,
@@ -63,7 +83,9 @@ class InputPanel(wx.Panel):
     def create_primer_checker(self):
         """ Creates a new PrimerChecker object according to the
         experimental checking values in the gui. Those are from the
-        widgets dimer_check, self_dimer_check and hairpin_check.
+        widgets dimer_check, self_dimer_check and hairpin_check, which
+        compare the free energy to a threshold with free_energy_check.
+        The melting temperature model is from nearest_neighbor_check.
 
         Parameters:
             -
@@ -74,7 +96,10 @@ class InputPanel(wx.Panel):
         check_self_dimer = self.self_dimer_check.GetValue()
         check_hairpin = self.hairpin_check.GetValue()
         return PrimerChecker(dimer=check_dimer, self_dimer=check_self_dimer,
-                             hairpin=check_hairpin)
+                             hairpin=check_hairpin,
+                             nearest_neighbor=self.nearest_neighbor_check
+                             .GetValue(),
+                             free_energy=self.free_energy_check.GetValue())
 
     ## Event methods
 
@@ -82,8 +107,9 @@ class InputPanel(wx.Panel):
         """ Binds the events to the widgets of this and
         result panel.
         """
-        self.dna_field.Bind(wx.EVT_TEXT, self.check_sequence)
+        self.dna_field.Bind(wx.EVT_TEXT, self.edit_sequence)
         self.dna_field.Bind(wx.EVT_TEXT_PASTE, self.paste_fasta)
+        self.Bind(wx.EVT_TIMER, self.check_sequence, self.check_timer)
         self.anneal_range_minimum.Bind(
             wx.EVT_SPINCTRL, event_wrapper(self.range_handler,
                                            self.anneal_range_maximum, True))
@@ -98,8 +124,46 @@ class InputPanel(wx.Panel):
                                            self.target_range_minimum, False))
         self.use_target.Bind(wx.EVT_CHECKBOX, self.set_additional_widgets)
 
+    def edit_sequence(self, evt):
+        """ Handles an edit of the DNA input field. Only the span of the
+        edit is remembered, the check is done once no edits were made
+        for CHECK_DELAY milliseconds, see `check_sequence`. Typing
+        inserts at most a character before the insertion point, pastes
+        are handled by `paste_fasta`. Editing the field while it shows
+        the summary of a pasted sequence clears the sequence.
+
+        Parameters:
+            evt - The wx text event
+        Returns:
+            -
+        """
+        if self.replacing:
+            return
+        if self.pasted_sequence is not None:
+            self.pasted_sequence = None
+            self.pending_span = None
+            self.dna_field.ChangeValue("")
+            self.text_length = 0
+            self.check_timer.Start(self.CHECK_DELAY, wx.TIMER_ONE_SHOT)
+            return
+        length = self.dna_field.GetLastPosition()
+        difference = length - self.text_length
+        self.text_length = length
+        end = self.dna_field.GetInsertionPoint()
+        start = max(end - max(difference, 1), 0)
+        if self.pending_span is not None:
+            # The pending span moves along with the text after the edit
+            edit = end - max(difference, 0)
+            pending_start, pending_end = [
+                max(position + difference, edit) if position >= edit
+                else position for position in self.pending_span]
+            start = min(start, pending_start)
+            end = max(end, pending_end)
+        self.pending_span = start, end
+        self.check_timer.Start(self.CHECK_DELAY, wx.TIMER_ONE_SHOT)
+
     def check_sequence(self, *args):
-        """ Checks the sequence of the input field and removes unkown
+        """ Checks the edited span of the input field and removes unkown
         nucleotides. Case does not matter, but those characters are
         allowed: a, t, c, g, n and x.
         This method also adjusts setting limits so the max value of
@@ -112,11 +176,20 @@ class InputPanel(wx.Panel):
         Returns:
             A boolean whether the check was succesful or not.
         """
-        sequence = self.dna_field.GetValue()
-        sequence = re.sub("[^atcgnxATCGNX]", "", sequence)
-        self.dna_field.ChangeValue(sequence)
-        if sequence:
-            length_seq = len(sequence)
+        self.check_timer.Stop()
+        if self.pending_span is not None:
+            start, end = self.pending_span
+            self.pending_span = None
+            end = min(end, self.dna_field.GetLastPosition())
+            span = self.dna_field.GetRange(start, end)
+            cleaned = self.INVALID_NUCLEOTIDES.sub("", span)
+            if cleaned != span:
+                self.replacing = True
+                self.dna_field.Replace(start, end, cleaned)
+                self.replacing = False
+                self.text_length = self.dna_field.GetLastPosition()
+        length_seq = self.get_sequence_length()
+        if length_seq:
             self.anneal_range_minimum.SetRange(1, length_seq - 1)
             self.anneal_range_maximum.SetRange(2, length_seq)
             self.max_pcr.SetRange(1, length_seq)
@@ -128,11 +201,35 @@ class InputPanel(wx.Panel):
             self.anneal_range_maximum.SetRange(1, 2)
         return False
 
+    def get_sequence_length(self):
+        """ Returns the length of the sequence of the input field. """
+        if self.pasted_sequence is not None:
+            return len(self.pasted_sequence)
+        return self.dna_field.GetLastPosition()
+
+    def get_sequence(self):
+        """ Retrieves the checked sequence, pending edits are checked
+        first.
+
+        Parameters:
+            -
+        Returns:
+            The sequence, either from the DNA input field or the pasted
+            sequence which is too long to show.
+        """
+        if self.pending_span is not None:
+            self.check_sequence()
+        if self.pasted_sequence is not None:
+            return self.pasted_sequence
+        return self.dna_field.GetValue()
+
     def paste_fasta(self, evt):
         """ Manages the pasting of text into the DNA input field. This
         also supports the FASTA format (for a single sequence) by
         checking for a '>' at the beginning of the text and then simply
-        removes the first line.
+        removes the first line. The pasted text replaces the sequence.
+        Long texts are normalized in a worker thread, see
+        `normalize_paste`.
 
         Parameters:
             evt - The wx paste event object.
@@ -142,16 +239,80 @@ class InputPanel(wx.Panel):
         # Get the paste value
         if not wx.TheClipboard.IsOpened():
             wx.TheClipboard.Open()
+        text = None
         text_data_object = wx.TextDataObject()
         if wx.TheClipboard.GetData(text_data_object):
             text = text_data_object.GetText()
-            # Remove fasta header
-            if text.startswith('>'):
-                data = text.split('\n')
-                del data[0]
-                text = ''.join(data)
-            self.dna_field.SetValue(text)
         wx.TheClipboard.Close()
+        if text is None:
+            return
+        self.paste_count += 1
+        if len(text) > self.LARGE_PASTE:
+            self.progress_text.SetLabel("Reading pasted sequence...")
+            worker = threading.Thread(target=self.normalize_paste,
+                                      args=(text, self.paste_count))
+            worker.daemon = True
+            worker.start()
+        else:
+            self.finish_paste(self.normalize_fasta(text), self.paste_count)
+
+    def normalize_fasta(self, text):
+        """ Removes the FASTA header and the unknown nucleotides (like
+        line breaks) of a pasted text. The text is normalized in chunks
+        of NORMALIZE_CHUNK characters, since a single regular expression
+        call over a large paste would freeze the main thread, even when
+        it runs in a worker thread.
+
+        Parameters:
+            text - The pasted text
+        Returns:
+            The sequence
+        """
+        if text.startswith('>'):
+            text = text.partition('\n')[2]
+        return "".join(self.INVALID_NUCLEOTIDES.sub(
+            "", text[start:start + self.NORMALIZE_CHUNK])
+            for start in range(0, len(text), self.NORMALIZE_CHUNK))
+
+    def normalize_paste(self, text, paste_number):
+        """ Normalizes a pasted text in a worker thread, the sequence is
+        handed to `finish_paste` on the main thread.
+
+        Parameters:
+            text - The pasted text
+            paste_number - The number of the paste
+        Returns:
+            -
+        """
+        wx.CallAfter(self.finish_paste, self.normalize_fasta(text),
+                     paste_number)
+
+    def finish_paste(self, sequence, paste_number):
+        """ Puts a normalized pasted sequence in the DNA input field,
+        unless another paste came after it. Sequences longer than
+        LARGE_PASTE are kept aside and the field only shows their
+        length.
+
+        Parameters:
+            sequence - The normalized sequence
+            paste_number - The number of the paste
+        Returns:
+            -
+        """
+        if paste_number != self.paste_count:
+            return
+        self.pending_span = None
+        if len(sequence) > self.LARGE_PASTE:
+            self.pasted_sequence = sequence
+            self.dna_field.ChangeValue(
+                "Pasted sequence of {} nucleotides, edit to clear it"
+                .format(len(sequence)))
+            self.progress_text.SetLabel("")
+        else:
+            self.pasted_sequence = None
+            self.dna_field.ChangeValue(sequence)
+        self.text_length = self.dna_field.GetLastPosition()
+        self.check_sequence()
 
     def set_additional_widgets(self, *args):
         """ Sets the maximum pcr product size according to the range of
@@ -233,9 +394,17 @@ class InputPanel(wx.Panel):
                           "f": "anneal_range_maximum"}]
         self.primers_button = wx.Button(
             self, wx.ID_ANY, label="Search primers")
+        # The cancel button and progress of a running search
+        self.cancel_button = wx.Button(self, wx.ID_ANY, label="Cancel")
+        self.cancel_button.Disable()
+        self.progress_text = wx.StaticText(self, wx.ID_ANY, "")
+        search_box = wx.BoxSizer(wx.HORIZONTAL)
+        search_box.Add(self.primers_button, 2, wx.EXPAND)
+        search_box.Add(self.cancel_button, 1, wx.EXPAND | wx.LEFT, 5)
         settings_box = wx.BoxSizer(wx.VERTICAL)
         settings_box.Add(self.create_widget_box(input_settings), 3, wx.EXPAND)
-        settings_box.Add(self.primers_button, 1, wx.ALIGN_BOTTOM | wx.EXPAND)
+        settings_box.Add(self.progress_text, 0, wx.EXPAND)
+        settings_box.Add(search_box, 1, wx.ALIGN_BOTTOM | wx.EXPAND)
         return settings_box
 
     def create_optional_input(self):
@@ -270,7 +439,17 @@ class InputPanel(wx.Panel):
                              {"t": "Experimental self dimer checking",
                              "f": "self_dimer_check"},
                              {"t": "Experimental hairpin checking",
-                             "f": "hairpin_check"}]
+                             "f": "hairpin_check"},
+                             {"t": "Free energy dimer and hairpin checks",
+                             "f": "free_energy_check"},
+                             {"t": "Nearest-neighbor melting temperature",
+                             "f": "nearest_neighbor_check"},
+                             {"t": "Reject off-target primers",
+                             "f": "specificity_check"},
+                             {"t": "Rank primer pairs",
+                             "f": "rank_check"},
+                             {"t": "Show search report",
+                             "f": "report_check"}]
         checkbox_creator = lambda parent: wx.CheckBox(parent, wx.ID_ANY)
         optional_settings.Add(self.create_widget_box(checkbox_settings,
                               checkbox_creator), 1, wx.EXPAND | wx.LEFT, 5)
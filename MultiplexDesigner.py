@@ -0,0 +1,333 @@
+from CandidateStore import CandidateSession
+from PrimerChecker import count_bits
+
+
+class MultiplexDesigner(object):
+    """ Designs a multiplex panel: one primer pair for every target, of
+    which no two pairs can form a dimer with each other. The targets
+    can be on one or more templates, every target has a finder of its
+    own (an AllPrimerFinder or TargetPrimerFinder), which generates the
+    ranked candidate pairs of the target.
+    Two candidate pairs of different targets conflict when any of their
+    primers can form a dimer, or when their PCR products overlap on the
+    same template. The conflicts are kept in a matrix with a row per
+    candidate pair, which is an integer bitset of the pairs it conflicts
+    with. Only the part of a row with the pairs which are still allowed
+    is created, once the solver needs it.
+    The solver is a branch and bound search, which picks the target
+    with the fewest compatible candidates left first and tries its
+    candidates best first, see `solve`. It starts from the best of two
+    greedy panels, see `warm_start`, so running out of nodes never
+    leaves a panel worse than those.
+    """
+
+    # The amount of ranked candidate pairs of every target
+    CANDIDATES_PER_TARGET = 200
+    # The maximum amount of nodes the solver visits
+    MAX_NODES = 1000
+    # The amount of best candidates of a target the greedy panel compares
+    WARM_START_CANDIDATES = 8
+
+    def __init__(self, primer_checker, candidates_per_target=None,
+                 max_nodes=None):
+        """ Creates an empty panel.
+
+        Parameters:
+            primer_checker - The PrimerChecker which checks for dimers
+            between the pairs of different targets.
+            candidates_per_target - The amount of candidate pairs of
+            every target, CANDIDATES_PER_TARGET by default.
+            max_nodes - The maximum amount of nodes of the search,
+            MAX_NODES by default.
+        Returns:
+            -
+        """
+        self.primer_checker = primer_checker
+        self.candidates_per_target = (candidates_per_target or
+                                      self.CANDIDATES_PER_TARGET)
+        self.max_nodes = max_nodes or self.MAX_NODES
+        self.targets = []
+
+    def add_target(self, name, finder):
+        """ Adds a target to the panel.
+
+        Parameters:
+            name - The name of the target
+            finder - The PrimerFinder of the target
+        Returns:
+            -
+        """
+        self.targets.append((name, finder))
+
+    def generate_candidates(self):
+        """ Generates the ranked candidate pairs of every target and
+        indexes their primers. A target of which the search fails, for
+        instance because of an unknown nucleotide, gets no candidates
+        and its error is kept in target_errors, so the other targets
+        are still designed.
+
+        Parameters:
+            -
+        Returns:
+            -
+        """
+        # The match, target, primer indexes and amplicon of every pair
+        self.pairs = []
+        # The range of the pair indexes of every target
+        self.target_ranges = []
+        # The exception of the search of every target, or None
+        self.target_errors = []
+        # The primer sequences (5' to 3') and their indexes
+        self.primers = []
+        primer_indexes = {}
+        # The targets of a template share the scanned candidates
+        session = CandidateSession()
+        session.MAX_STORES = max(len(self.targets), 1)
+        for target, (_, finder) in enumerate(self.targets):
+            if finder.candidate_store is None:
+                finder.candidate_store = session.store_for(finder)
+            start = len(self.pairs)
+            template = finder.sequence_digest()
+            try:
+                matches = finder.find_ranked_pairs(
+                    self.candidates_per_target)
+            except Exception as error:
+                matches = []
+                self.target_errors.append(error)
+            else:
+                self.target_errors.append(None)
+            for match in matches:
+                indexes = []
+                # The reverse primer of a match is shown 3' to 5'
+                for primer in (match['fprimer']['seq'],
+                               match['rprimer']['seq'][::-1]):
+                    if primer not in primer_indexes:
+                        primer_indexes[primer] = len(self.primers)
+                        self.primers.append(primer)
+                    indexes.append(primer_indexes[primer])
+                amplicon = (template, match['fprimer']['position'][0],
+                            match['rprimer']['position'][1])
+                self.pairs.append((match, target, indexes, amplicon))
+            self.target_ranges.append((start, len(self.pairs)))
+        # The checked columns and dimers of the rows of the primers
+        self._primer_conflicts = {}
+
+    def primer_conflicts(self, primer, primers):
+        """ Retrieves the part of the row of the dimer matrix of a primer
+        with the other primers of the panel, see
+        `PrimerChecker.dimer_matrix`. Every row is filled in as far as
+        it is needed, since most of the matrix is never used. Dimers
+        are symmetric, so the checked primers are filled in in their
+        rows as well.
+
+        Parameters:
+            primer - The index of the primer
+            primers - A bitset of the primers of the row which are
+            needed
+        Returns:
+            A bitset of the needed primers it can form a dimer with
+        """
+        checked, dimers = self._primer_conflicts.get(primer, (0, 0))
+        missing = primers & ~checked
+        if missing:
+            columns = []
+            while missing:
+                bit = missing & -missing
+                columns.append(bit.bit_length() - 1)
+                missing ^= bit
+            row = self.primer_checker.dimer_matrix(
+                [self.primers[primer]], self.primers, [columns])[0]
+            bit = 1 << primer
+            for column in columns:
+                other_checked, other_dimers = self._primer_conflicts.get(
+                    column, (0, 0))
+                if row >> column & 1:
+                    other_dimers |= bit
+                self._primer_conflicts[column] = (other_checked | bit,
+                                                  other_dimers)
+            checked |= primers
+            dimers |= row
+            self._primer_conflicts[primer] = checked, dimers
+        return dimers & primers
+
+    def pair_conflicts(self, pair, allowed):
+        """ Creates the part of the row of the conflict matrix of a
+        candidate pair with the pairs which are still allowed, the pairs
+        of its own target are left out since only one of them is picked
+        anyway.
+
+        Parameters:
+            pair - The index of the candidate pair
+            allowed - A bitset of the pairs which are still allowed
+        Returns:
+            A bitset of the allowed pairs it conflicts with
+        """
+        _, target, indexes, amplicon = self.pairs[pair]
+        start, end = self.target_ranges[target]
+        allowed &= ~(((1 << end) - 1) ^ ((1 << start) - 1))
+        row = 0
+        primers = 0
+        others = []
+        while allowed:
+            bit = allowed & -allowed
+            other = bit.bit_length() - 1
+            allowed ^= bit
+            others.append(other)
+            _, _, other_indexes, other_amplicon = self.pairs[other]
+            for primer in other_indexes:
+                primers |= 1 << primer
+            if (amplicon[0] == other_amplicon[0] and
+                    amplicon[1] < other_amplicon[2] and
+                    other_amplicon[1] < amplicon[2]):
+                row |= bit
+        dimers = 0
+        for primer in indexes:
+            dimers |= self.primer_conflicts(primer, primers)
+        if dimers:
+            for other in others:
+                for primer in self.pairs[other][2]:
+                    if dimers >> primer & 1:
+                        row |= 1 << other
+                        break
+        return row
+
+    def greedy_panel(self, target_masks, candidates):
+        """ Picks a greedy panel: the open target with the fewest
+        compatible candidates left is picked first, and of its best
+        compatible candidates the one which leaves the most open
+        targets coverable, and then the most compatible pairs, is
+        picked.
+
+        Parameters:
+            target_masks - A bitset of the candidate pairs of every
+            target
+            candidates - The amount of best compatible candidates of a
+            target which are compared
+        Returns:
+            A list with the picked pair index of every target, None for
+            the targets which are left out.
+        """
+        picked = [None] * len(self.targets)
+        allowed = (1 << len(self.pairs)) - 1
+        open_targets = set(range(len(self.targets)))
+        while open_targets:
+            counts = [(count_bits(allowed & target_masks[target]), target)
+                      for target in open_targets]
+            counts = [count for count in counts if count[0]]
+            if not counts:
+                break
+            _, target = min(counts)
+            open_targets.discard(target)
+            others = allowed & ~target_masks[target]
+            start, end = self.target_ranges[target]
+            best = None
+            tried = 0
+            for pair in range(start, end):
+                if not allowed >> pair & 1:
+                    continue
+                left = others & ~self.pair_conflicts(pair, others)
+                if candidates == 1:
+                    best = (None, pair, left)
+                    break
+                score = (sum(1 for other in open_targets
+                             if left & target_masks[other]),
+                         count_bits(left))
+                if best is None or score > best[0]:
+                    best = (score, pair, left)
+                tried += 1
+                if tried == candidates:
+                    break
+            _, picked[target], allowed = best
+        return picked
+
+    def warm_start(self, target_masks, coverable):
+        """ Creates the first panel of the solver: the greedy panel
+        which takes the best compatible candidate of every target, or
+        when that one leaves targets out, the better one of it and the
+        greedy panel which compares WARM_START_CANDIDATES candidates,
+        see `greedy_panel`.
+
+        Parameters:
+            target_masks - A bitset of the candidate pairs of every
+            target
+            coverable - The amount of targets which have candidates
+        Returns:
+            A list with the picked pair index of every target, None for
+            the targets which are left out, and the amount of covered
+            targets.
+        """
+        best = None
+        for candidates in (1, self.WARM_START_CANDIDATES):
+            picked = self.greedy_panel(target_masks, candidates)
+            covered = sum(1 for pair in picked if pair is not None)
+            if best is None or covered > best[1]:
+                best = [picked, covered]
+            if best[1] == coverable:
+                break
+        return best
+
+    def solve(self):
+        """ Searches for a compatible pair of every target. The search
+        keeps a bitset of the pairs which are still compatible with the
+        picked pairs, picks the open target with the fewest of those
+        left and tries them best first, or leaves the target out. A
+        branch is cut off when it cannot cover more targets than the
+        best panel so far, and the search stops at a panel covering
+        every target which has candidates, or after max_nodes nodes.
+        The best panel so far starts as the greedy one of `warm_start`.
+
+        Parameters:
+            -
+        Returns:
+            A list with the picked pair index of every target, None for
+            the targets which are left out.
+        """
+        target_masks = [((1 << end) - 1) ^ ((1 << start) - 1)
+                        for start, end in self.target_ranges]
+        coverable = sum(1 for mask in target_masks if mask)
+        best = self.warm_start(target_masks, coverable)
+        nodes = [0]
+
+        def search(allowed, picked, covered, open_targets):
+            nodes[0] += 1
+            if covered > best[1]:
+                best[0] = list(picked)
+                best[1] = covered
+            if best[1] == coverable or nodes[0] > self.max_nodes:
+                return
+            counts = [(count_bits(allowed & target_masks[target]), target)
+                      for target in open_targets]
+            counts = [count for count in counts if count[0]]
+            if not counts or covered + len(counts) <= best[1]:
+                return
+            _, target = min(counts)
+            remaining = [other for _, other in counts if other != target]
+            start, end = self.target_ranges[target]
+            others = allowed & ~target_masks[target]
+            for pair in range(start, end):
+                if allowed >> pair & 1:
+                    picked[target] = pair
+                    search(others & ~self.pair_conflicts(pair, others),
+                           picked, covered + 1, remaining)
+                    picked[target] = None
+                    if best[1] == coverable or nodes[0] > self.max_nodes:
+                        return
+            search(others, picked, covered, remaining)
+
+        search((1 << len(self.pairs)) - 1, [None] * len(self.targets), 0,
+               range(len(self.targets)))
+        return best[0]
+
+    def design(self):
+        """ Designs the panel, see `generate_candidates` and `solve`.
+
+        Parameters:
+            -
+        Returns:
+            A list of (name, match) tuples in order of the targets, the
+            match is None when the target has no (compatible) pair.
+        """
+        self.generate_candidates()
+        picked = self.solve()
+        return [(name, None if pair is None else self.pairs[pair][0])
+                for (name, _), pair in zip(self.targets, picked)]
@@ -0,0 +1,125 @@
+from array import array
+from math import log
+
+
+class NearestNeighbor(object):
+    """ Calculates melting temperatures with the nearest-neighbor model
+    of SantaLucia (1998), with the unified stacking parameters and the
+    entropy salt correction. The enthalpy and entropy of the
+    dinucleotide stacks of a whole sequence are summed cumulatively
+    once, so the melting temperature of any window of that sequence is
+    calculated in constant time, see `window_melt_temp`.
+    Primers are assumed not to be self complementary (those are
+    rejected as self dimers anyway), so the symmetry correction is not
+    applied. Windows which contain an unknown nucleotide have no
+    melting temperature.
+    """
+
+    # The enthalpy (0.1 kcal/mol) and entropy (0.1 cal/K/mol) of every
+    # stack, by the 5' to 3' dinucleotide of either strand. These are
+    # integers, so the cumulative sums are exact and a window always
+    # gets the same melting temperature, whichever sequence it is in.
+    stacks = {
+        'AA': (-79, -222), 'TT': (-79, -222),
+        'AT': (-72, -204),
+        'TA': (-72, -213),
+        'CA': (-85, -227), 'TG': (-85, -227),
+        'GT': (-84, -224), 'AC': (-84, -224),
+        'CT': (-78, -210), 'AG': (-78, -210),
+        'GA': (-82, -222), 'TC': (-82, -222),
+        'CG': (-106, -272),
+        'GC': (-98, -244),
+        'GG': (-80, -199), 'CC': (-80, -199)}
+    # The initiation of a duplex by its terminal nucleotides, in the
+    # same units
+    initiations = dict(A=(23, 41), T=(23, 41), G=(1, -28), C=(1, -28))
+    # The gas constant in cal/K/mol
+    GAS_CONSTANT = 1.987
+
+    def __init__(self, sodium=50, primer_concentration=250):
+        """ Creates the model for the reaction conditions.
+
+        Parameters:
+            sodium - The concentration of monovalent cations in mM
+            primer_concentration - The concentration of the primers in
+            nM
+        Returns:
+            -
+        """
+        self.sodium = sodium
+        self.primer_concentration = primer_concentration
+        self.salt_entropy = 0.368 * log(sodium / 1000.0)
+        self.concentration_entropy = self.GAS_CONSTANT * log(
+            primer_concentration / 1e9 / 4)
+
+    def configuration(self):
+        """ Returns the settings which determine the melting
+        temperatures, so results can be cached per configuration.
+        """
+        return self.sodium, self.primer_concentration
+
+    def stack_prefix_sums(self, sequence):
+        """ Sums the enthalpy and entropy of the stacks of a sequence
+        cumulatively. The stacks of the window sequence[offset:offset +
+        length] are then prefix[offset + length - 1] - prefix[offset].
+
+        Parameters:
+            sequence - The (uppercase) sequence to sum
+        Returns:
+            A tuple of the sequence and arrays with the cumulative
+            enthalpy, entropy (both in the units of the stacks) and
+            amount of unknown stacks.
+        """
+        enthalpy = array('l', [0])
+        entropy = array('l', [0])
+        unknown = array('l', [0])
+        total_enthalpy = total_entropy = total_unknown = 0
+        for offset in range(len(sequence) - 1):
+            stack = self.stacks.get(sequence[offset:offset + 2])
+            if stack is None:
+                total_unknown += 1
+            else:
+                total_enthalpy += stack[0]
+                total_entropy += stack[1]
+            enthalpy.append(total_enthalpy)
+            entropy.append(total_entropy)
+            unknown.append(total_unknown)
+        return sequence, enthalpy, entropy, unknown
+
+    def window_melt_temp(self, tables, offset, length):
+        """ Calculates the melting temperature of a window in constant
+        time.
+
+        Parameters:
+            tables - The tables of `stack_prefix_sums`
+            offset - The start of the window
+            length - The length of the window
+        Returns:
+            The melting temperature in degrees Celsius, or NaN when the
+            window contains an unknown nucleotide.
+        """
+        sequence, enthalpy, entropy, unknown = tables
+        end = offset + length - 1
+        first = self.initiations.get(sequence[offset])
+        last = self.initiations.get(sequence[end])
+        if first is None or last is None or unknown[end] != unknown[offset]:
+            return float('nan')
+        duplex_enthalpy = (enthalpy[end] - enthalpy[offset] + first[0] +
+                           last[0]) * 100.0
+        duplex_entropy = ((entropy[end] - entropy[offset] + first[1] +
+                           last[1]) / 10.0 +
+                          self.salt_entropy * (length - 1))
+        return (duplex_enthalpy /
+                (duplex_entropy + self.concentration_entropy) - 273.15)
+
+    def melt_temp(self, primer):
+        """ Calculates the melting temperature of a single primer, like
+        `window_melt_temp` does for a window.
+
+        Parameters:
+            primer - The primer to calculate it for
+        Returns:
+            The melting temperature in degrees Celsius
+        """
+        return self.window_melt_temp(self.stack_prefix_sums(primer), 0,
+                                     len(primer))
@@ -0,0 +1,155 @@
+from array import array
+
+
+class PairResults(object):
+    """ The ranked primer pairs of a search, as two array columns with
+    the indexes of the forward and reverse primer of every pair in the
+    PrimerCandidates of the search. The rows of a table are created on
+    demand, so a view only pays for the rows it shows. The rows can be
+    sorted on the rank, the PCR product size, the melting temperature
+    difference or the position of the pair, the sort keys are
+    calculated once per column.
+    """
+
+    # The headers of the columns of `row`
+    COLUMNS = ("Rank", "Forward primer", "Reverse primer", "Forward Tm",
+               "Reverse Tm", "Tm difference", "Forward GC%", "Reverse GC%",
+               "Forward position", "Reverse position", "PCR")
+    # The sort key of the columns which can be sorted on
+    SORT_KEYS = {0: 'rank', 5: 'melt_temp_difference', 8: 'position',
+                 10: 'pcr'}
+
+    def __init__(self, finder, primers, pairs):
+        """ Creates the results of a search.
+
+        Parameters:
+            finder - The AllPrimerFinder of the search
+            primers - The PrimerCandidates of the search
+            pairs - A list of (forward index, reverse index) tuples, the
+            best pair first.
+        Returns:
+            -
+        """
+        self.finder = finder
+        self.primers = primers
+        self.forward_indexes = array('l', (pair[0] for pair in pairs))
+        self.reverse_indexes = array('l', (pair[1] for pair in pairs))
+        # The pair of every row
+        self.order = array('l', range(len(pairs)))
+        self.sort_key = 'rank'
+        self.descending = False
+        self._sort_columns = {}
+        self._last_row = None
+
+    def __len__(self):
+        return len(self.forward_indexes)
+
+    def sort_column(self, key):
+        """ Calculates the sort key of every pair for a sort key, which
+        is rank, pcr, melt_temp_difference or position.
+        """
+        if key not in self._sort_columns:
+            primers = self.primers
+            offsets = primers.offsets
+            pairs = zip(self.forward_indexes, self.reverse_indexes)
+            if key == 'rank':
+                column = range(len(self))
+            elif key == 'pcr':
+                lengths = primers.lengths
+                column = array('l', (offsets[reverse] - offsets[forward] +
+                                     lengths[reverse]
+                                     for forward, reverse in pairs))
+            elif key == 'melt_temp_difference':
+                melt_temps = primers.melt_temps
+                column = array('d', (abs(melt_temps[reverse] -
+                                         melt_temps[forward])
+                                     for forward, reverse in pairs))
+            elif key == 'position':
+                column = array('l', (offsets[forward]
+                                     for forward in self.forward_indexes))
+            else:
+                raise ValueError("Unknown sort key: {}".format(key))
+            self._sort_columns[key] = column
+        return self._sort_columns[key]
+
+    def sort(self, key, descending=False):
+        """ Sorts the rows on a sort key, see `sort_column`. Pairs with
+        the same sort key stay in order of rank.
+
+        Parameters:
+            key - The sort key
+            descending - Whether to sort from high to low
+        Returns:
+            -
+        """
+        column = self.sort_column(key)
+        self.order = array('l', sorted(range(len(self)),
+                                       key=column.__getitem__,
+                                       reverse=descending))
+        self.sort_key = key
+        self.descending = descending
+        self._last_row = None
+
+    def toggle_sort(self, column):
+        """ Sorts the rows on a column of the table, sorting on the
+        sorted column again reverses the order.
+
+        Parameters:
+            column - The index of the column in COLUMNS
+        Returns:
+            Whether the rows were sorted, since not every column can be
+            sorted on.
+        """
+        key = self.SORT_KEYS.get(column)
+        if key is None:
+            return False
+        self.sort(key, not self.descending if key == self.sort_key
+                  else False)
+        return True
+
+    def row(self, row):
+        """ Creates the texts of a row of the table, the last row is
+        cached since a view asks for every column of a row separately.
+
+        Parameters:
+            row - The index of the row in the sorted order
+        Returns:
+            A tuple with the text of every column of COLUMNS
+        """
+        if self._last_row is not None and self._last_row[0] == row:
+            return self._last_row[1]
+        primers = self.primers
+        pair = self.order[row]
+        forward = self.forward_indexes[pair]
+        reverse = self.reverse_indexes[pair]
+        forward_temp = primers.melt_temp(forward)
+        reverse_temp = primers.melt_temp(reverse)
+        forward_position = primers.position(forward)
+        reverse_position = primers.position(reverse)
+        texts = (str(pair + 1),
+                 "5'-{}-3'".format(primers.seq(forward)),
+                 "5'-{}-3'".format(self.finder.complement_sequence(
+                     primers.seq(reverse), False)),
+                 "{}C".format(forward_temp), "{}C".format(reverse_temp),
+                 "{:g}C".format(abs(forward_temp - reverse_temp)),
+                 "{:.1f}%".format(primers.gc_perc(forward)),
+                 "{:.1f}%".format(primers.gc_perc(reverse)),
+                 "{}..{}".format(*forward_position),
+                 "{}..{}".format(*reverse_position),
+                 str(reverse_position[1] - forward_position[0]))
+        self._last_row = row, texts
+        return texts
+
+    def match(self, row):
+        """ Creates the match of a row like `AllPrimerFinder.find_primers`
+        returns it.
+
+        Parameters:
+            row - The index of the row in the sorted order
+        Returns:
+            The match dictionary
+        """
+        pair = self.order[row]
+        return self.finder.create_match(
+            self.primers[self.forward_indexes[pair]],
+            self.primers[self.reverse_indexes[pair]])
@@ -0,0 +1,129 @@
+import json
+import os
+import sqlite3
+import time
+import zlib
+from hashlib import sha1
+
+
+class PrimerCache(object):
+    """ A persistent cache of scanned primer candidates in a sqlite
+    database within a local directory, so templates which are used over
+    and over do not have to be scanned again in a new run. It contains
+    the state of a CandidateStore (the columns of every window with its
+    absolute position and the single_primer_filter verdicts) by a key
+    of the template digest, PrimerChecker configuration and candidate
+    configuration, see `make_key`.
+    The cache is limited by max_size, the least recently used entries
+    are evicted first. Entries of another ALGORITHM_VERSION are never
+    used and removed when the cache is opened.
+    """
+
+    # Increase this when a change of the checks or scanning changes
+    # which primers are found, or when the state of a store changes.
+    # This invalidates all cached entries.
+    ALGORITHM_VERSION = 3
+    # The name of the database file within the cache directory
+    DATABASE_NAME = "primer_cache.sqlite"
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        """ Opens (or creates) the cache in a directory.
+
+        Parameters:
+            directory - The directory of the cache
+            max_size - The maximum size of all entries in bytes
+        Returns:
+            -
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.max_size = max_size
+        self.connection = sqlite3.connect(
+            os.path.join(directory, self.DATABASE_NAME), timeout=60)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, "
+                "version INTEGER, size INTEGER, used REAL, state BLOB)")
+            self.connection.execute(
+                "DELETE FROM entries WHERE version != ?",
+                (self.ALGORITHM_VERSION,))
+
+    def make_key(self, finder):
+        """ Creates the key of the candidates of a finder, which are
+        determined by the template, the PrimerChecker configuration and
+        the candidate configuration.
+
+        Parameters:
+            finder - The AllPrimerFinder to create the key for
+        Returns:
+            The key as a hexadecimal digest
+        """
+        return sha1(repr((finder.sequence_digest(),
+                          finder.primer_checker.configuration(),
+                          finder.candidate_configuration()))
+                    .encode("ascii")).hexdigest()
+
+    def load(self, key, store):
+        """ Loads a cached entry into a CandidateStore.
+
+        Parameters:
+            key - The key from `make_key`
+            store - The (empty) CandidateStore to load into
+        Returns:
+            Whether the entry was in the cache (True) or not (False)
+        """
+        row = self.connection.execute(
+            "SELECT state FROM entries WHERE key = ? AND version = ?",
+            (key, self.ALGORITHM_VERSION)).fetchone()
+        if row is None:
+            return False
+        state = json.loads(zlib.decompress(bytes(row[0])).decode("ascii"))
+        store.start = state["start"]
+        store.end = state["end"]
+        store.windows.load_columns(state["windows"])
+        store.verdicts = state["verdicts"]
+        with self.connection:
+            self.connection.execute(
+                "UPDATE entries SET used = ? WHERE key = ?",
+                (time.time(), key))
+        return True
+
+    def save(self, key, store):
+        """ Saves the state of a CandidateStore and evicts the least
+        recently used entries when the cache grew too large.
+
+        Parameters:
+            key - The key from `make_key`
+            store - The CandidateStore to save
+        Returns:
+            -
+        """
+        state = zlib.compress(json.dumps(
+            dict(start=store.start, end=store.end,
+                 windows=store.windows.columns(),
+                 verdicts=store.verdicts)).encode("ascii"))
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, self.ALGORITHM_VERSION, len(state), time.time(),
+                 sqlite3.Binary(state)))
+            self.evict()
+
+    def evict(self):
+        """ Removes the least recently used entries until all entries
+        fit in max_size.
+        """
+        total = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        rows = self.connection.execute(
+            "SELECT key, size FROM entries ORDER BY used").fetchall()
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            self.connection.execute("DELETE FROM entries WHERE key = ?",
+                                    (key,))
+            total -= size
+
+    def close(self):
+        """ Closes the database. """
+        self.connection.close()
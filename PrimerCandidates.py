@@ -0,0 +1,185 @@
+from array import array
+
+
+class Primer(object):
+    """ A single primer as it is shown to the user, with the fields
+    seq, gc_perc, melt_temp, offset and position. These are only
+    created for the primers of a match, the search itself works on the
+    columns of PrimerCandidates. The fields can also be accessed like
+    the keys of a dictionary, like primer["seq"].
+    """
+
+    __slots__ = ('seq', 'gc_perc', 'melt_temp', 'offset', 'position')
+
+    def __init__(self, seq, gc_perc, melt_temp, offset, position):
+        self.seq = seq
+        self.gc_perc = gc_perc
+        self.melt_temp = melt_temp
+        self.offset = offset
+        self.position = position
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __eq__(self, other):
+        return (isinstance(other, Primer) and
+                self.as_dict() == other.as_dict())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Primer({!r})".format(self.as_dict())
+
+    def as_dict(self):
+        """ Returns the fields of the primer as a dictionary. """
+        return dict((key, getattr(self, key)) for key in self.__slots__)
+
+
+class PrimerCandidates(object):
+    """ A compact list of primer candidates within a sequence, stored
+    as parallel array columns of the offset, length, GC count and
+    melting temperature of every candidate. The primer sequence, GC%
+    and absolute position are derived on demand, so no string or
+    object is kept per candidate. Indexing or iterating creates a
+    Primer for every candidate.
+    """
+
+    # The columns with their array type codes
+    COLUMNS = (('offsets', 'l'), ('lengths', 'B'), ('gc_counts', 'B'),
+               ('melt_temps', 'd'))
+
+    def __init__(self, sequence=None, anneal_minimum=0, primer_checker=None):
+        """ Creates an empty list of candidates.
+
+        Parameters:
+            sequence - The sequence the offsets are counted in
+            anneal_minimum - The absolute position of the sequence
+            (zero based), used for the positions of the primers.
+            primer_checker - The PrimerChecker which calculates the GC%
+        Returns:
+            -
+        """
+        self.sequence = sequence
+        self.anneal_minimum = anneal_minimum
+        self.primer_checker = primer_checker
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.primer(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.primer(index)
+
+    def append(self, offset, length, gc_count, melt_temp):
+        """ Adds a candidate at the end.
+
+        Parameters:
+            offset - The offset of the candidate within the sequence
+            length - The length of the candidate
+            gc_count - The amount of G and C nucleotides
+            melt_temp - The melting temperature
+        Returns:
+            -
+        """
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        self.gc_counts.append(gc_count)
+        self.melt_temps.append(melt_temp)
+
+    def append_from(self, other, index, shift=0):
+        """ Adds a candidate of another list of candidates at the end.
+
+        Parameters:
+            other - The PrimerCandidates to copy from
+            index - The index of the candidate in other
+            shift - The amount to add to the offset
+        Returns:
+            -
+        """
+        self.append(other.offsets[index] + shift, other.lengths[index],
+                    other.gc_counts[index], other.melt_temps[index])
+
+    def seq(self, index):
+        """ Slices the sequence of a candidate from the sequence. """
+        offset = self.offsets[index]
+        return self.sequence[offset:offset + self.lengths[index]]
+
+    def gc_perc(self, index):
+        """ Calculates the GC% of a candidate. """
+        return self.primer_checker.calc_count_details(
+            self.gc_counts[index], self.lengths[index])[0]
+
+    def position(self, index):
+        """ Calculates the absolute position of a candidate.
+
+        Parameters:
+            index - The index of the candidate
+        Returns:
+            A tuple with the start and end integer.
+        """
+        start = self.anneal_minimum + self.offsets[index] + 1
+        return start, start + self.lengths[index]
+
+    def melt_temp(self, index):
+        """ Retrieves the melting temperature of a candidate, whole
+        degrees (like those of the Wallace rule) as an integer.
+        """
+        melt_temp = self.melt_temps[index]
+        if melt_temp.is_integer():
+            return int(melt_temp)
+        return melt_temp
+
+    def primer(self, index):
+        """ Creates the Primer of a candidate. """
+        return Primer(self.seq(index), self.gc_perc(index),
+                      self.melt_temp(index), self.offsets[index],
+                      self.position(index))
+
+    def take(self, indexes):
+        """ Creates a list of candidates of a selection of these
+        candidates, within the same sequence.
+
+        Parameters:
+            indexes - The indexes of the candidates to take, in order
+        Returns:
+            A new PrimerCandidates
+        """
+        taken = PrimerCandidates(self.sequence, self.anneal_minimum,
+                                 self.primer_checker)
+        for name, _ in self.COLUMNS:
+            column = getattr(self, name)
+            getattr(taken, name).extend(column[index] for index in indexes)
+        return taken
+
+    def columns(self):
+        """ Returns the columns as a dictionary of lists, which can be
+        dumped as JSON.
+        """
+        return dict((name, getattr(self, name).tolist())
+                    for name, _ in self.COLUMNS)
+
+    def load_columns(self, columns):
+        """ Replaces the candidates by the columns from `columns`. """
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode, columns[name]))
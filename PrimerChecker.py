@@ -1,27 +1,45 @@
-import re
+from array import array
+from FreeEnergy import FreeEnergy
+from NearestNeighbor import NearestNeighbor
 
 
 _check_methods = "dimer", "hairpin", "self_dimer"
 
 
+def count_bits(number):
+    """ Counts the amount of set bits in a (non negative) integer. """
+    return bin(number).count("1")
+
+
 class PrimerChecker(object):
     """ The PrimerChecker object will check dimers, self dimers and
-    hairpins determined by the parameters in the constructor. These
-    are all experimental since it is string based and DOES NOT
-    CALCULATE the Gibbs free energy which usually is done.
-    Every method depends is_dimer, however when the dimer check is
-    disabled this will not effect the result of self dimers or
-    hairpins. This is done through the python magic method
-    `__getattribute__` and an internal variable called
-    `_internal_override`
+    hairpins determined by the parameters in the constructor. By
+    default these are all experimental since it is string based and
+    DOES NOT CALCULATE the Gibbs free energy which usually is done.
+    With free_energy enabled, the checks compare the Gibbs free energy
+    of the most stable structure (see FreeEnergy) to a threshold
+    instead of counting bonds.
+    The self dimer check depends on is_dimer, however when the dimer
+    check is disabled this will not effect the result of self dimers.
+    This is done through the python magic method `__getattribute__`
+    and an internal variable called `_internal_override`. Hairpins are
+    checked with a match table of their own, see `find_hairpin_fold`.
     This class also contains utility methods to check primers, for
-    instance `calc_primer_details`
+    instance `calc_primer_details`. Melting temperatures are calculated
+    with the Wallace rule, or with the nearest-neighbor model when it
+    is enabled in the constructor.
     """
 
     complement_dict = dict(A='T', T='A', C='G', G='C')
+    # The one-hot bits of every nucleotide used by `encode_primer`
+    nucleotide_bits = dict(A=1, C=2, G=4, T=8)
+    # The maximum amount of cached primer encodings
+    ENCODING_CACHE_SIZE = 100000
 
     def __init__(self, required_bonds=6, dimer=True, self_dimer=True,
-                 hairpin=True):
+                 hairpin=True, nearest_neighbor=False, sodium=50,
+                 primer_concentration=250, free_energy=False,
+                 dimer_delta_g=-9.0, hairpin_delta_g=-3.0):
         """ This method will configure whether methods are enabled
         (True) or disabled (False). When a method is disabled, the
         method will always return True to ensure all checks pass
@@ -33,6 +51,20 @@ class PrimerChecker(object):
             dimer - Enables or disables `is_dimer`
             self_dimer - Enables or disables `is_self_dimer`
             hairpin -  - Enables or disables `hairpin`
+            nearest_neighbor - Whether to calculate melting
+            temperatures with the nearest-neighbor model (True) or the
+            Wallace rule (False).
+            sodium - The concentration of monovalent cations in mM for
+            the nearest-neighbor model
+            primer_concentration - The concentration of the primers in
+            nM for the nearest-neighbor model
+            free_energy - Whether to check dimers, self dimers and
+            hairpins by their Gibbs free energy (True) or by the
+            required_bonds (False).
+            dimer_delta_g - The free energy (kcal/mol) at or below
+            which two primers form a (self) dimer
+            hairpin_delta_g - The free energy (kcal/mol) at or below
+            which a primer forms a hairpin
         Returns:
             -
         """
@@ -40,7 +72,61 @@ class PrimerChecker(object):
         self.check_dimer = dimer
         self.check_self_dimer = self_dimer
         self.check_hairpin = hairpin
+        self.nearest_neighbor = None
+        if nearest_neighbor:
+            self.nearest_neighbor = NearestNeighbor(sodium,
+                                                    primer_concentration)
+        self.free_energy = None
+        self.dimer_delta_g = dimer_delta_g
+        self.hairpin_delta_g = hairpin_delta_g
+        if free_energy:
+            self.free_energy = FreeEnergy()
         self._internal_override = False
+        self._encodings = {}
+
+    def encode_primer(self, primer, complement=False):
+        """ Encodes a primer as an integer bitmask which has 4 bits per
+        position, of which one is set for the nucleotide on that
+        position (one-hot). Spaces are encoded without any bits set.
+        The number of bonds between two aligned primers is then the
+        amount of set bits in the AND of the complement mask of the one
+        primer and the mask of the other primer. The encodings are
+        cached, since primers are checked against many other primers.
+
+        Parameters:
+            primer - The primer to encode, may contain spaces
+            complement - Whether to encode the complement of every
+            nucleotide (True) or the nucleotide itself (False)
+        Returns:
+            The integer bitmask of the primer
+        """
+        key = primer, complement
+        mask = self._encodings.get(key)
+        if mask is None:
+            if len(self._encodings) >= self.ENCODING_CACHE_SIZE:
+                self._encodings.clear()
+            mask = 0
+            for i, nucleotide in enumerate(primer):
+                if nucleotide == ' ':
+                    continue
+                if complement:
+                    nucleotide = self.complement_dict[nucleotide]
+                mask |= self.nucleotide_bits[nucleotide] << (4 * i)
+            self._encodings[key] = mask
+        return mask
+
+    def configuration(self):
+        """ Returns the settings which determine the outcome of the
+        checks, so results can be cached per configuration.
+        """
+        configuration = (self.required_bonds, self.check_dimer,
+                         self.check_self_dimer, self.check_hairpin)
+        if self.nearest_neighbor is not None:
+            configuration += (self.nearest_neighbor.configuration(),)
+        if self.free_energy is not None:
+            configuration += (('free_energy', self.dimer_delta_g,
+                               self.hairpin_delta_g),)
+        return configuration
 
     def check_bonds(self, primer_a, primer_b):
         """ Checks whether the two sequences can are bound together and
@@ -73,13 +159,153 @@ class PrimerChecker(object):
             2. The melting temperature
             This is a tuple.
         """
-        gc_length = len(re.findall('[GC]', primer))
+        gc_length = primer.count('G') + primer.count('C')
+        gc_perc, melting_temp = self.calc_count_details(gc_length,
+                                                        len(primer))
+        if self.nearest_neighbor is not None:
+            melting_temp = self.nearest_neighbor.melt_temp(primer)
+        return gc_perc, melting_temp
+
+    def calc_count_details(self, gc_length, primer_length):
+        """ Calculates the melting temperature and GC% of a primer from
+        the amount of G and C nucleotides in it. This is the shared
+        calculation of `calc_primer_details` and
+        `calc_window_details`, so both always agree. The melting
+        temperature is the one of the Wallace rule.
+
+        Parameters:
+            gc_length - The amount of G and C nucleotides
+            primer_length - The length of the primer
+        Returns:
+            A tuple of the GC percentage and the melting temperature
+        """
         # Calculate the GC%
-        gc_perc = (float(gc_length) / len(primer)) * 100
+        gc_perc = (float(gc_length) / primer_length) * 100
         # Calculate the melting temp
-        melting_temp = 4 * gc_length + 2 * (len(primer) - gc_length)
+        melting_temp = 4 * gc_length + 2 * (primer_length - gc_length)
         return gc_perc, melting_temp
 
+    def gc_prefix_sums(self, sequence):
+        """ Creates the cumulative GC count of a sequence. The GC count
+        of the window sequence[offset:offset + length] is then
+        prefix[offset + length] - prefix[offset].
+
+        Parameters:
+            sequence - The (uppercase) sequence to count in
+        Returns:
+            An array with len(sequence) + 1 cumulative GC counts
+        """
+        prefix = array('l', [0])
+        gc_length = 0
+        for nucleotide in sequence:
+            if nucleotide == 'G' or nucleotide == 'C':
+                gc_length += 1
+            prefix.append(gc_length)
+        return prefix
+
+    def calc_window_details(self, gc_prefix, offset, primer_length):
+        """ Calculates the GC% and melting temperature of a window of a
+        sequence in constant time, using the prefix sums of
+        `gc_prefix_sums`.
+
+        Parameters:
+            gc_prefix - The cumulative GC counts of the sequence
+            offset - The start of the window
+            primer_length - The length of the window
+        Returns:
+            A tuple of the GC percentage and the melting temperature
+        """
+        gc_length = gc_prefix[offset + primer_length] - gc_prefix[offset]
+        return self.calc_count_details(gc_length, primer_length)
+
+    def melt_temp_tables(self, sequence):
+        """ Creates the tables which `calc_window_melt_temp` needs for
+        the windows of a sequence. Only the nearest-neighbor model
+        needs tables, the Wallace rule only needs the GC count.
+
+        Parameters:
+            sequence - The (uppercase) sequence
+        Returns:
+            The tables, or None for the Wallace rule
+        """
+        if self.nearest_neighbor is None:
+            return None
+        return self.nearest_neighbor.stack_prefix_sums(sequence)
+
+    def calc_window_melt_temp(self, tables, gc_prefix, offset,
+                              primer_length):
+        """ Calculates the melting temperature of a window of a sequence
+        in constant time, with the same model as `calc_primer_details`.
+
+        Parameters:
+            tables - The tables of `melt_temp_tables`
+            gc_prefix - The cumulative GC counts of the sequence
+            offset - The start of the window
+            primer_length - The length of the window
+        Returns:
+            The melting temperature
+        """
+        if tables is not None:
+            return self.nearest_neighbor.window_melt_temp(tables, offset,
+                                                          primer_length)
+        return self.calc_window_details(gc_prefix, offset, primer_length)[1]
+
+    def gc_count_range(self, primer_length, gc_window, melt_temp_window):
+        """ Determines which GC counts give a primer of the given length
+        a GC% and melting temperature within both windows. Both values
+        only depend on the GC count, so this turns both filters into a
+        single range check on the prefix sums. The melting temperature
+        of the nearest-neighbor model does not only depend on the GC
+        count, so it is not checked with that model.
+
+        Parameters:
+            primer_length - The length of the primer
+            gc_window - A tuple with the minimum and maximum GC%
+            melt_temp_window - A tuple with the minimum and maximum
+            melting temperature
+        Returns:
+            A tuple with the minimum and maximum GC count, or None when
+            no GC count passes.
+        """
+        passing = []
+        for gc_length in range(primer_length + 1):
+            gc_perc, melting_temp = self.calc_count_details(gc_length,
+                                                            primer_length)
+            in_melt_temp_window = (self.nearest_neighbor is not None or
+                                   melt_temp_window[0] <= melting_temp <=
+                                   melt_temp_window[1])
+            if gc_window[0] <= gc_perc <= gc_window[1] and in_melt_temp_window:
+                passing.append(gc_length)
+        if not passing:
+            return None
+        return passing[0], passing[-1]
+
+    def window_mask(self, gc_prefix, primer_length, gc_window,
+                    melt_temp_window):
+        """ Creates a boolean mask over all offsets of a sequence which
+        tells whether the window of the given length at that offset
+        passes the GC% and melting temperature windows. With the
+        nearest-neighbor model only the GC% window is checked, see
+        `gc_count_range`.
+
+        Parameters:
+            gc_prefix - The cumulative GC counts of the sequence
+            primer_length - The length of the windows
+            gc_window - A tuple with the minimum and maximum GC%
+            melt_temp_window - A tuple with the minimum and maximum
+            melting temperature
+        Returns:
+            A list of booleans, one for every offset which still has a
+            complete window.
+        """
+        gc_range = self.gc_count_range(primer_length, gc_window,
+                                       melt_temp_window)
+        if gc_range is None:
+            return [False] * max(len(gc_prefix) - primer_length, 0)
+        minimum, maximum = gc_range
+        return [minimum <= end - start <= maximum for start, end
+                in zip(gc_prefix, gc_prefix[primer_length:])]
+
     def is_dimer(self, primer_a, primer_b):
         """ Checks whether primer_a and primer_b can form a dimer based
         on the required_bonds setting in the constructor. The largest
@@ -88,7 +314,11 @@ class PrimerChecker(object):
         primers, the first primer (primer_a) is picked to be the "large"
         primer. This behaviour is used in `is_hairpin`
         This method will move the small primer along the large primer,
-        so every possibility is accounted for.
+        so every possibility is accounted for. Every position is scored
+        at once, see `encode_primer`, but the result is the same as
+        scoring it with `check_bonds`.
+        With free_energy enabled, the primers form a dimer when the free
+        energy of their most stable duplex is at most dimer_delta_g.
 
         Parameters:
             primer_a - A primer containing no spaces
@@ -97,21 +327,111 @@ class PrimerChecker(object):
             Whether the two primers can form a dimer (True) or not
             (False).
         """
+        if self.free_energy is not None:
+            return self.free_energy.duplex_delta_g(
+                primer_a, primer_b,
+                limit=self.dimer_delta_g) <= self.dimer_delta_g
         # Assume primers dont have whitespace and are uppercase
         large_primer = primer_a if len(primer_a) >= len(primer_b) else primer_b
         small_primer = primer_b if large_primer == primer_a else primer_a
-        # Move the smallest primer along the larger primer
-        start_index = len(small_primer) - self.required_bonds
-        end_index = start_index + len(large_primer)
-        moving_primer = (small_primer +
-                         (" " * (len(large_primer) - self.required_bonds)))
-        for _ in range(len(moving_primer) - self.required_bonds):
-            if self.check_bonds(large_primer,
-                                moving_primer[start_index:end_index]):
+        complement_mask = self.encode_primer(large_primer, True)
+        moving_mask = self.encode_primer(small_primer)
+        # Move the smallest primer along the larger primer, a shift
+        # tells which position of the small primer lies against the
+        # first position of the large primer.
+        for shift in range(self.required_bonds - len(large_primer) + 1,
+                           len(small_primer) - self.required_bonds + 1):
+            if shift >= 0:
+                aligned_mask = moving_mask >> (4 * shift)
+            else:
+                aligned_mask = moving_mask << (-4 * shift)
+            if count_bits(complement_mask & aligned_mask) >= \
+                    self.required_bonds:
                 return True
-            moving_primer = " " + moving_primer[:-1]
         return False
 
+    def dimer_check(self, primer_a):
+        """ Prepares a primer to be checked against many other primers
+        for dimers. The complement mask of primer_a is encoded once and
+        shifted once for every alignment, the shifted masks are kept per
+        length of the other primer. Checking a primer then only takes
+        its (cached) encoding and an AND per alignment. The bonds
+        between two aligned primers are symmetric, so this gives the
+        same result as `is_dimer`, whichever primer is the largest.
+        With free_energy enabled, primer_a is prepared once and its rows
+        of the free energy table are reused for every other primer.
+
+        Parameters:
+            primer_a - A primer containing no spaces
+        Returns:
+            A function which takes another primer and tells whether the
+            two primers can form a dimer (True) or not (False), like
+            `is_dimer`.
+        """
+        if not self.check_dimer:
+            return lambda primer_b: False
+        if self.free_energy is not None:
+            free_energy = self.free_energy
+            threshold = self.dimer_delta_g
+            prepared = free_energy.prepare(primer_a)
+            return lambda primer_b: free_energy.duplex_delta_g(
+                primer_a, primer_b, prepared, threshold) <= threshold
+        required = self.required_bonds
+        length_a = len(primer_a)
+        complement_mask = self.encode_primer(primer_a, True)
+        shifted_masks = {}
+
+        def check(primer_b):
+            length_b = len(primer_b)
+            masks = shifted_masks.get(length_b)
+            if masks is None:
+                # The shifts of `is_dimer`, of which the large primer
+                # lies still and the small primer moves along it.
+                if length_a >= length_b:
+                    shifts = range(required - length_a + 1,
+                                   length_b - required + 1)
+                else:
+                    shifts = range(required - length_a,
+                                   length_b - required)
+                masks = [complement_mask << (4 * shift) if shift >= 0
+                         else complement_mask >> (-4 * shift)
+                         for shift in shifts]
+                shifted_masks[length_b] = masks
+            mask = self.encode_primer(primer_b)
+            for shifted_mask in masks:
+                if count_bits(shifted_mask & mask) >= required:
+                    return True
+            return False
+        return check
+
+    def dimer_matrix(self, primers_a, primers_b, candidates=None):
+        """ Checks a whole block of primer combinations for dimers. The
+        result is a matrix with a row for every primer of primers_a,
+        which is an integer bitset where bit j is set when the primer
+        can form a dimer with primers_b[j]. Every row is prepared once
+        with `dimer_check`. Just like `is_dimer`, no bits are set when
+        the dimer check is disabled.
+
+        Parameters:
+            primers_a - A list of primers for the rows of the matrix
+            primers_b - A list of primers for the columns of the matrix
+            candidates - Optionally a list with for every row the
+            column indexes to check, the other columns are left unset.
+        Returns:
+            A list with a bitset for every row
+        """
+        matrix = []
+        for row, primer_a in enumerate(primers_a):
+            columns = (range(len(primers_b)) if candidates is None
+                       else candidates[row])
+            is_dimer = self.dimer_check(primer_a)
+            bits = 0
+            for column in columns:
+                if is_dimer(primers_b[column]):
+                    bits |= 1 << column
+            matrix.append(bits)
+        return matrix
+
     def is_self_dimer(self, primer):
         """ This will check whether the primer can form a dimer with
         another primer of the same type. This means that a check is
@@ -131,28 +451,96 @@ class PrimerChecker(object):
         return output
 
     def is_hairpin(self, primer):
-        """ Checks whether the primer can form a hairpin.
+        """ Checks whether the primer can form a hairpin. The primer is
+        folded at every point, after which the part before and after
+        the fold are checked like `is_dimer` would.
+        With free_energy enabled, the primer forms a hairpin when the
+        free energy of its most stable hairpin is at most
+        hairpin_delta_g.
 
         Parameters:
             primer - The primer to do the hairpin check on
         Returns:
             Whether the primer can form a hairpin (True) or not (False)
         """
+        if self.free_energy is not None:
+            return (self.free_energy.hairpin_delta_g(primer) <=
+                    self.hairpin_delta_g)
         if len(primer) < self.required_bonds * 2:
             return False
-        self._internal_override = True
-        for i in range(self.required_bonds + 1, len(primer)):
-            a = primer[:i - 1]
-            b = primer[i + 1:]
-            len_difference = abs(len(a) - len(b))
-            full = a if len(a) > len(b) else b
-            padded = (" " * len_difference) + (b if full == a else a)
-            if self.is_dimer(full, padded):
-                self._internal_override = False
-                return True
-        self._internal_override = False
+        return self.find_hairpin_fold(primer)
+
+    def diagonal_bonds(self, primer):
+        """ Creates the diagonal match table of a primer, which contains
+        the cumulative bonds along every diagonal. Nucleotide x can
+        bond with nucleotide x + delta when the complement of the one
+        is the other, so the amount of bonds between x = start and
+        x = end on a diagonal is diagonals[delta][end] -
+        diagonals[delta][start].
+
+        Parameters:
+            primer - The primer to create the table for
+        Returns:
+            A list with the cumulative bonds for every delta, delta 0
+            is not used.
+        """
+        diagonals = [None]
+        for delta in range(1, len(primer)):
+            bonds = 0
+            cumulative = [0]
+            for x in range(len(primer) - delta):
+                if self.complement_dict[primer[x]] == primer[x + delta]:
+                    bonds += 1
+                cumulative.append(bonds)
+            diagonals.append(cumulative)
+        return diagonals
+
+    def find_hairpin_fold(self, primer):
+        """ Looks for a fold of the primer which forms enough bonds to
+        be a hairpin, see `is_hairpin`. For the fold at i the part
+        primer[:i - 1] is aligned with primer[i + 1:], of which the
+        shortest part is aligned to the end of the longest part, and
+        moved along it as `is_dimer` does. Every fold and shift pairs
+        up a range of one diagonal of the match table, so the bonds are
+        counted in constant time.
+
+        Parameters:
+            primer - The primer to check, at least twice as long as the
+            required bonds.
+        Returns:
+            Whether a fold of the primer forms a hairpin
+        """
+        required = self.required_bonds
+        diagonals = self.diagonal_bonds(primer)
+        for i in range(required + 1, len(primer)):
+            length_before = i - 1
+            length_after = len(primer) - i - 1
+            length = max(length_before, length_after)
+            difference = abs(length_before - length_after)
+            for shift in range(required - length + 1, length - required + 1):
+                if length_before > length_after:
+                    start = max(0, difference - shift)
+                    end = min(length, length - shift)
+                    delta = i + 1 + shift - difference
+                else:
+                    start = max(0, shift - difference)
+                    end = min(length_before, length + shift - difference)
+                    delta = i + 1 + difference - shift
+                if (end - start >= required and
+                        diagonals[delta][end] - diagonals[delta][start] >=
+                        required):
+                    return True
         return False
 
+    def __getstate__(self):
+        """ Creates the state to pickle this object with, the cache of
+        encodings is left out since it is only useful within this
+        process.
+        """
+        state = dict(self.__dict__)
+        state['_encodings'] = {}
+        return state
+
     def __getattribute__(self, key):
         """ This is a 'magic method' in python and should not be called
         directly unless a child class needs the super form.
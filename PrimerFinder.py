@@ -1,4 +1,23 @@
+from hashlib import sha1
 from re import split
+from FastaReader import FastaSequence
+from SearchReport import SearchReport
+
+
+class SearchCancelled(Exception):
+    """ Raised within a search when it is cancelled with
+    `PrimerFinder.cancel`.
+    """
+
+
+class NormalizedSequence(str):
+    """ A sequence which is already normalized (upper case without
+    whitespace), which a PrimerFinder uses as is. The digest of the
+    sequence can be kept with it, so a template which is searched many
+    times is only normalized and hashed once.
+    """
+
+    digest = None
 
 
 class PrimerFinder(object):
@@ -6,6 +25,11 @@ class PrimerFinder(object):
     input from the input and modifies the sequence to make sure it
     is upper case. This is already done in the GUI, but this is a
     standalone class and should also do it.
+    Long searches report their progress through progress_callback and
+    can be cancelled from another thread with `cancel`. Setting report
+    to an enabled SearchReport instruments the search, the report stays
+    available as the report of the finder afterwards, whether primers
+    were found or not.
     The method `find_primers` should be considered as a main method.
     This should return a list of results which look like the
     following structure:
@@ -16,17 +40,24 @@ class PrimerFinder(object):
     }
     """
 
+    # The size of the windows in which the sequence is hashed
+    DIGEST_WINDOW = 1 << 20
+
     def __init__(self, primer_checker, sequence, anneal_minimum,
                  anneal_maximum, max_pcr_product):
         """ The constructor of this class which initialises the
         input variables. Only the sequence is converted to uppercase
-        and removes all whitespace from it.
+        and removes all whitespace from it. A FastaSequence is already
+        normalized per window, so it is used as is and only the
+        annealing window is ever read from it. The same goes for a
+        NormalizedSequence.
 
         Parameters:
             primer_checker - A PrimerChecker object which handles the
             checks for dimers, self dimers and hairpins (experimentally)
             sequence - The sequence of nucleotides where primers need to
-            be found in.
+            be found in, either a string, a FastaSequence or a
+            NormalizedSequence.
             anneal_minimim - Determines the minimum of the range of the
             actual sequence which primers are allowed to anneal to.
             anneal_maximum - Determines the maximum of the range of the
@@ -37,10 +68,75 @@ class PrimerFinder(object):
             -
         """
         self.primer_checker = primer_checker
-        self.sequence = "".join(split("\s+", sequence.upper()))
+        if isinstance(sequence, (FastaSequence, NormalizedSequence)):
+            self.sequence = sequence
+        else:
+            self.sequence = "".join(split("\s+", sequence.upper()))
         self.anneal_minimum = anneal_minimum - 1
         self.anneal_maximum = anneal_maximum
         self.max_pcr_product = max_pcr_product
+        # Called with a copy of the counters on every progress report
+        self.progress_callback = None
+        self.cancelled = False
+        self.counters = dict(candidates=0, filtered=0, pairs=0)
+        self.digest = getattr(sequence, 'digest', None)
+        # The (opt-in) instrumentation of the search
+        self.report = SearchReport()
+
+    def __getstate__(self):
+        """ Creates the state to pickle this object with, for instance
+        to send it to a worker process. The sequence is left out, since
+        the workers get their own part of it and a memory mapped
+        sequence cannot be pickled.
+        """
+        state = dict(self.__dict__)
+        state['sequence'] = None
+        state['progress_callback'] = None
+        return state
+
+    def cancel(self):
+        """ Cancels the search, which is then stopped at the next
+        progress report by raising SearchCancelled. This can be called
+        from any thread.
+        """
+        self.cancelled = True
+
+    def report_progress(self, counter, amount):
+        """ Adds to a progress counter and reports the counters to the
+        progress_callback. This is also the point where a cancelled
+        search is stopped.
+
+        Parameters:
+            counter - The name of the counter, this is candidates,
+            filtered or pairs.
+            amount - The amount to add to the counter
+        Returns:
+            -
+        """
+        self.counters[counter] += amount
+        if self.cancelled:
+            raise SearchCancelled()
+        if self.progress_callback is not None:
+            self.progress_callback(dict(self.counters))
+
+    def sequence_digest(self):
+        """ Calculates the SHA1 digest of the (normalized) sequence,
+        which identifies the template in caches. The sequence is
+        hashed in windows, so a memory mapped sequence is never read
+        at once.
+
+        Parameters:
+            -
+        Returns:
+            The hexadecimal digest
+        """
+        if self.digest is None:
+            digest = sha1()
+            for start in range(0, len(self.sequence), self.DIGEST_WINDOW):
+                digest.update(self.sequence[start:start + self.DIGEST_WINDOW]
+                              .encode("ascii"))
+            self.digest = digest.hexdigest()
+        return self.digest
 
     def complement_sequence(self, sequence, flip_sequence=True):
         """ Creates the complement of a given sequence.
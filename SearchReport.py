@@ -0,0 +1,102 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+
+
+class SearchReport(object):
+    """ Collects the instrumentation of a single search: the wall time
+    of every stage and the amount of candidates and pairs which were
+    rejected by every filter. A report is disabled by default, in which
+    case nothing is measured, so a search only pays for the
+    instrumentation when it is asked for.
+    The rejections of the candidates are named gc_window,
+    melt_temp_window, duplicate, out_of_reach (out of reach of the
+    target), self_dimer, hairpin and off_target. The rejections
+    of the pairs are named max_pcr_product, overlap,
+    melt_temp_difference, dimer and target_range. Pairs which are out
+    of reach of the pair index are never evaluated and thus not
+    counted, just like windows which a CandidateStore did not have to
+    scan again.
+    """
+
+    def __init__(self, enabled=False):
+        """ Creates an empty report.
+
+        Parameters:
+            enabled - Whether to measure anything (True) or not (False)
+        Returns:
+            -
+        """
+        self.enabled = enabled
+        self.stage_times = OrderedDict()
+        self.rejections = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        """ Measures the wall time of a stage, which is the body of the
+        with statement this is used in. The time of a stage which runs
+        multiple times is summed.
+
+        Parameters:
+            name - The name of the stage
+        Returns:
+            A context manager
+        """
+        if not self.enabled:
+            yield
+            return
+        start = default_timer()
+        try:
+            yield
+        finally:
+            self.stage_times[name] = (self.stage_times.get(name, 0) +
+                                      default_timer() - start)
+
+    def reject(self, name, amount=1):
+        """ Counts rejections of a filter.
+
+        Parameters:
+            name - The name of the filter
+            amount - The amount of rejected candidates or pairs
+        Returns:
+            -
+        """
+        if self.enabled:
+            self.rejections[name] = self.rejections.get(name, 0) + amount
+
+    def merge(self, other):
+        """ Adds the measurements of another report, for instance of a
+        worker process, to this report.
+
+        Parameters:
+            other - The SearchReport to add
+        Returns:
+            -
+        """
+        for name, seconds in other.stage_times.items():
+            self.stage_times[name] = self.stage_times.get(name, 0) + seconds
+        for name, amount in other.rejections.items():
+            self.reject(name, amount)
+
+    def as_dict(self):
+        """ Returns the report as a dictionary with the stage times in
+        seconds and the rejections, which can be dumped as JSON.
+        """
+        return dict(stage_times=dict(self.stage_times),
+                    rejections=dict(self.rejections))
+
+    def format(self):
+        """ Formats the report as text to show to the user.
+
+        Parameters:
+            -
+        Returns:
+            Two lines of text, one with the stage times and one with the
+            rejections.
+        """
+        times = ", ".join("{} {:.2f}s".format(name, seconds)
+                          for name, seconds in self.stage_times.items())
+        rejections = ", ".join("{} {}".format(name, amount)
+                               for name, amount in self.rejections.items())
+        return "Stages: {}\nRejected: {}".format(times or "-",
+                                                 rejections or "-")
@@ -1,86 +1,94 @@
 import wx
+from PairResults import PairResults
+
+
+class ResultList(wx.ListCtrl):
+    """ A virtual list of the primer pairs of PairResults. Only the
+    rows which are shown are asked for, so the size of the results does
+    not matter. Clicking a column header sorts the rows on that column,
+    see `PairResults.toggle_sort`.
+    """
+
+    def __init__(self, parent, id):
+        """ Creates an empty list with the columns of PairResults. """
+        super(ResultList, self).__init__(parent, id, style=(
+            wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL | wx.LC_HRULES))
+        for column, header in enumerate(PairResults.COLUMNS):
+            self.InsertColumn(column, header)
+        self.results = None
+        self.Bind(wx.EVT_LIST_COL_CLICK, self.sort_column)
+
+    def set_results(self, results):
+        """ Shows the rows of PairResults, or no rows for None. """
+        self.results = results
+        self.SetItemCount(len(results) if results is not None else 0)
+        for column in range(self.GetColumnCount()):
+            self.SetColumnWidth(column, wx.LIST_AUTOSIZE_USEHEADER)
+        self.Refresh()
+
+    def sort_column(self, event):
+        """ Sorts the rows on the clicked column. """
+        if (self.results is not None and
+                self.results.toggle_sort(event.GetColumn())):
+            self.Refresh()
+
+    def OnGetItemText(self, item, column):
+        return self.results.row(item)[column]
 
 
 class ShowPanel(wx.Panel):
 
     def __init__(self, parent, id):
         """ Creates the panel which contains the primer information.
-        Contains a sizer of which the first two elements are
-        placeholders for primer info or a text displaying
-        'no primers found'
+        Contains a text with the amount of primer pairs or
+        'no primers found', the list of the primer pairs and the text of
+        the report of the search. The panel is reused for every search.
         This panel is initially hidden.
         """
         super(ShowPanel, self).__init__(parent, id)
         self.main_sizer = wx.BoxSizer(wx.VERTICAL)
+        self.summary_text = wx.StaticText(self, wx.ID_ANY, "")
+        self.result_list = ResultList(self, wx.ID_ANY)
+        self.report_text = wx.StaticText(self, wx.ID_ANY, "")
         self.return_button = wx.Button(self, wx.ID_ANY,
                                        label="Return to settings")
+        self.main_sizer.Add(self.summary_text, 0, wx.EXPAND | wx.ALL, 5)
+        self.main_sizer.Add(self.result_list, 4, wx.EXPAND)
+        self.main_sizer.Add(self.report_text, 0, wx.EXPAND)
         self.main_sizer.Add(self.return_button, 1, wx.EXPAND)
         self.SetSizer(self.main_sizer)
         self.Hide()
 
-    def set_primer(self, primer_match):
-        """ Sets the primer match for this panel. If no primer_match is
+    def set_results(self, results):
+        """ Sets the primer pairs for this panel. If no pairs are
         available a text will be displayed.
 
         Parameters:
-             primer_match - The match object to get the primers from
+             results - The PairResults of the search
         """
-        if primer_match:
-            title_box = wx.BoxSizer(wx.VERTICAL)
-            for text in "", "Sequence:", "Melt temp:", "GC%:", "Position:":
-                title_box.Add(self.create_text(text), 1, wx.EXPAND)
-            column_box = wx.BoxSizer(wx.HORIZONTAL)
-            column_box.Add(title_box, 1, wx.EXPAND)
-            column_box.Add(self.create_primer_box(primer_match['fprimer'], True),
-                           1, wx.EXPAND)
-            column_box.Add(self.create_primer_box(primer_match['rprimer'], False),
-                           1, wx.EXPAND)
-            pcr_box = wx.BoxSizer(wx.HORIZONTAL)
-            pcr_box.Add(self.create_text("PCR:"), 1, wx.EXPAND)
-            pcr_box.Add(self.create_text(str(len(primer_match['pcr']))), 1,
-                        wx.EXPAND)
-            pcr_box.Add((0, 0), 1, wx.EXPAND)
-            self.main_sizer.Prepend(pcr_box, 1, wx.EXPAND)
-            self.main_sizer.Prepend(column_box, 2, wx.EXPAND)
+        if results is not None and len(results) == 1:
+            self.summary_text.SetLabel("Found the best primer pair.")
+            self.result_list.set_results(results)
+            self.result_list.Show()
+        elif results is not None and len(results):
+            self.summary_text.SetLabel(
+                "Found {} primer pairs, the best pair first. Click a "
+                "column header to sort.".format(len(results)))
+            self.result_list.set_results(results)
+            self.result_list.Show()
         else:
-            center_text_wrapper = wx.BoxSizer(wx.HORIZONTAL)
-            center_text_wrapper.Add(self.create_text("No primers found"), 1,
-                                    wx.EXPAND | wx.ALIGN_CENTER)
-            self.main_sizer.Prepend(center_text_wrapper, 1, wx.ALIGN_CENTER)
-            self.main_sizer.Prepend((0, 0), 1, wx.EXPAND)
+            self.summary_text.SetLabel("No primers found")
+            self.result_list.set_results(None)
+            self.result_list.Hide()
         self.main_sizer.Layout()
 
-    def create_primer_box(self, primer, fpr):
-        """ Creates a box for the primer information.
-
-        Parameters:
-            primer - The primer to display information from
-            fpr - A boolean to indicate whether this is the forward
-            primer.
-        Returns:
-            A BoxSizer containing this information
-        """
-        primer_box = wx.BoxSizer(wx.VERTICAL)
-        primer["position"] = "{}..{}".format(*primer["position"])
-        primer_box.Add(
-            self.create_text("Forward primer" if fpr else "Reverse primer"), 1,
-            wx.EXPAND)
-        for format, key in (("5'-{}-3'", "seq"), ("{}C", "melt_temp"),
-                            ("{}%", "gc_perc"), ("{}", "position")):
-            primer_box.Add(self.create_text(format, str(primer[key])), 1, wx.EXPAND)
-        return primer_box
-
-    def create_text(self, text, *args, **kwargs):
-        """ Creates a StaticText and formats the text if any arguments
-        are given.
+    def set_report(self, report):
+        """ Shows the report of the search above the return button.
 
         Parameters:
-            text - The text to display and format
-            *args - Arguments to format the text
-            **kwargs - named arguments to format the text
-        Returns:
-            A StaticText
+            report - The SearchReport of the search, or None to hide
+            the report of an earlier search.
         """
-        if args or kwargs:
-            text = text.format(*args, **kwargs)
-        return wx.StaticText(self, wx.ID_ANY, text)
+        self.report_text.SetLabel(report.format() if report is not None
+                                 else "")
+        self.main_sizer.Layout()
@@ -0,0 +1,183 @@
+from array import array
+from AllPrimerFinder import AllPrimerFinder
+
+
+class SpecificityIndex(object):
+    """ An index of the seeds of a whole template, which is used to
+    check whether a primer can bind anywhere else than at its own
+    position. A primer binds at a site when the seed at its 3' end
+    (the last seed_length nucleotides) matches exactly and the rest of
+    the primer has at most max_mismatches mismatches, since mismatches
+    at the 5' end are tolerated by the polymerase.
+    The index is a table of the positions of every seed in the
+    template, sorted by the first prefix_length nucleotides of the seed
+    with a counting sort, so the sites of a seed are within a single
+    slice of the table. The prefix is at most as long as the seed and
+    short enough that the counting table is no bigger than the
+    template, so the index stays as small as the template for long
+    seeds as well. Only the forward strand is
+    indexed; sites on the reverse strand are found by looking up the
+    reverse complement of a primer. The index is built once per
+    template and can be reused by every search on it.
+    """
+
+    nucleotide_codes = dict(A=0, C=1, G=2, T=3)
+    complement_dict = dict(A='T', T='A', C='G', G='C')
+
+    def __init__(self, sequence, seed_length=10, max_mismatches=3):
+        """ Builds the index of a template.
+
+        Parameters:
+            sequence - The (normalized) template, either a string or a
+            FastaSequence.
+            seed_length - The length of the seed at the 3' end of a
+            primer which has to match exactly, at most the length of
+            the shortest primer.
+            max_mismatches - The maximum amount of mismatches in the
+            rest of the primer at a binding site.
+        Returns:
+            -
+        """
+        if not 1 <= seed_length <= AllPrimerFinder.MIN_PRIMER_LENGTH:
+            raise ValueError(
+                "The seed length should be between 1 and the length of "
+                "the shortest primer ({})".format(
+                    AllPrimerFinder.MIN_PRIMER_LENGTH))
+        self.template = sequence[0:len(sequence)]
+        self.seed_length = seed_length
+        self.max_mismatches = max_mismatches
+        self.prefix_length = 1
+        while (self.prefix_length < seed_length and
+               4 ** (self.prefix_length + 1) <= len(self.template)):
+            self.prefix_length += 1
+        seed_count = 4 ** seed_length
+        prefix_count = 4 ** self.prefix_length
+        suffix_count = 4 ** (seed_length - self.prefix_length)
+        # The code of the prefix of the seed ending at every position,
+        # or -1
+        codes = array('l')
+        code = 0
+        valid = 0
+        for nucleotide in self.template:
+            value = self.nucleotide_codes.get(nucleotide)
+            if value is None:
+                code = valid = 0
+            else:
+                code = (code * 4 + value) % seed_count
+                valid += 1
+            codes.append(code // suffix_count if valid >= seed_length
+                         else -1)
+        # The start of the positions of every prefix in the table
+        self.starts = array('l', [0]) * (prefix_count + 1)
+        for code in codes:
+            if code >= 0:
+                self.starts[code + 1] += 1
+        for code in range(prefix_count):
+            self.starts[code + 1] += self.starts[code]
+        self.positions = array('l', [0]) * self.starts[prefix_count]
+        filled = array('l', self.starts)
+        for end, code in enumerate(codes):
+            if code >= 0:
+                self.positions[filled[code]] = end - seed_length + 1
+                filled[code] += 1
+
+    def configuration(self):
+        """ Returns the settings which determine which primers are
+        specific, so results can be cached per configuration.
+        """
+        return self.seed_length, self.max_mismatches
+
+    def seed_positions(self, seed):
+        """ Looks up the positions where a seed occurs in the template.
+
+        Parameters:
+            seed - The seed, of seed_length nucleotides
+        Returns:
+            An array of the start positions, which is empty when the
+            seed contains an unknown nucleotide.
+        """
+        code = 0
+        for index, nucleotide in enumerate(seed):
+            value = self.nucleotide_codes.get(nucleotide)
+            if value is None:
+                return array('l')
+            if index < self.prefix_length:
+                code = code * 4 + value
+        positions = self.positions[self.starts[code]:self.starts[code + 1]]
+        if self.prefix_length == self.seed_length:
+            return positions
+        # The rest of the seed is compared with the template
+        template = self.template
+        length = self.seed_length
+        return array('l', [start for start in positions
+                           if template[start:start + length] == seed])
+
+    def reverse_complement(self, primer):
+        """ Creates the reverse complement of a primer, unknown
+        nucleotides are kept as is.
+        """
+        return "".join(self.complement_dict.get(nucleotide, nucleotide)
+                       for nucleotide in reversed(primer))
+
+    def count_mismatches(self, primer, site):
+        """ Counts the mismatches between a primer and a binding site,
+        counting stops as soon as there are too many.
+
+        Parameters:
+            primer - The (part of the) primer
+            site - The (part of the) site of equal length
+        Returns:
+            The amount of mismatches, up to max_mismatches + 1
+        """
+        mismatches = 0
+        for primer_nucleotide, site_nucleotide in zip(primer, site):
+            if primer_nucleotide != site_nucleotide:
+                mismatches += 1
+                if mismatches > self.max_mismatches:
+                    break
+        return mismatches
+
+    def binding_sites(self, primer):
+        """ Counts the sites on both strands of the template where a
+        primer binds.
+
+        Parameters:
+            primer - The primer sequence (5' to 3')
+        Returns:
+            The amount of binding sites
+        """
+        length = len(primer)
+        head_length = length - self.seed_length
+        sites = 0
+        # On the forward strand the seed is the end of the site
+        head = primer[:head_length]
+        for start in self.seed_positions(primer[head_length:]):
+            site = start - head_length
+            if (site >= 0 and self.count_mismatches(
+                    head, self.template[site:start]) <= self.max_mismatches):
+                sites += 1
+        # On the reverse strand the reverse complement of the primer
+        # is on the forward strand, with the seed at the start.
+        reverse = self.reverse_complement(primer)
+        tail = reverse[self.seed_length:]
+        for start in self.seed_positions(reverse[:self.seed_length]):
+            site = self.template[start + self.seed_length:start + length]
+            if (len(site) == head_length and self.count_mismatches(
+                    tail, site) <= self.max_mismatches):
+                sites += 1
+        return sites
+
+    def is_specific(self, primer):
+        """ Checks whether a primer candidate of the template binds at
+        its own position only. A candidate can become either primer of
+        a pair, so it is checked as forward primer (the candidate
+        itself) and as reverse primer (its reverse complement). Both
+        bind at the position of the candidate once.
+
+        Parameters:
+            primer - The primer candidate, as it occurs in the template
+        Returns:
+            Whether the primer binds nowhere else (True) or not (False)
+        """
+        return (self.binding_sites(primer) <= 1 and
+                self.binding_sites(self.reverse_complement(primer)) <= 1)
@@ -2,6 +2,14 @@ from AllPrimerFinder import AllPrimerFinder
 
 
 class TargetPrimerFinder(AllPrimerFinder):
+    """ Finds the primers of a PCR product which contains a target. The
+    forward primer has to start before target_minimum and the reverse
+    primer has to end after target_maximum, in the absolute (one based)
+    positions of `PrimerCandidates.position`, of which the end is
+    exclusive. Since the PCR product is at most max_pcr_product long,
+    only the candidates within reach of the target can be part of a
+    pair, so only those are checked, see `candidate_bounds`.
+    """
 
     def __init__(self, primer_checker, sequence, anneal_minimum,
                  anneal_maximum, max_pcr_product, target_minimum,
@@ -9,18 +17,39 @@ class TargetPrimerFinder(AllPrimerFinder):
         super(TargetPrimerFinder, self).__init__(
             primer_checker, sequence, anneal_minimum, anneal_maximum,
             max_pcr_product)
-        self.target_minimum = target_minimum - anneal_minimum
-        self.target_maximum = target_maximum - anneal_minimum
+        self.target_minimum = target_minimum
+        self.target_maximum = target_maximum
 
-    def range_primer_filter(self, forward_primer):
+    def candidate_bounds(self):
+        """ Returns the bounds of the candidates which can be part of a
+        pair, see `AllPrimerFinder.candidate_bounds`. A candidate at an
+        offset starts at position anneal_minimum + offset + 1 and ends
+        at that plus its length. A forward primer starts before the
+        target and a reverse primer ends after it, while the reverse end
+        minus the forward start (the PCR product) is at most
+        max_pcr_product:
+            target_maximum + 1 - max_pcr_product <= forward start
+                                                 <= target_minimum - 1
+            target_maximum + 1 <= reverse end
+                               <= target_minimum - 1 + max_pcr_product
+        """
+        # The position of the first nucleotide of the annealing sequence
+        first = self.anneal_minimum + 1
+        return ((self.target_maximum + 1 - self.max_pcr_product - first,
+                 self.target_minimum - 1 - first),
+                (self.target_maximum + 1 - first,
+                 self.target_minimum - 1 + self.max_pcr_product - first))
+
+    def range_primer_filter(self, primers, forward_index):
         super_check = (super(TargetPrimerFinder, self)
-                       .range_primer_filter(forward_primer))
-        start_forward = forward_primer["position"][0]
+                       .range_primer_filter(primers, forward_index))
+        start_forward = primers.position(forward_index)[0]
 
         def range_target_check(other):
-            end_reverse = other["position"][1]
+            end_reverse = primers.position(other)[1]
             if (start_forward < self.target_minimum
                     and end_reverse > self.target_maximum):
                 return super_check(other)
+            self.report.reject('target_range')
             return False
         return range_target_check
@@ -0,0 +1,188 @@
+from heapq import heappush, heappop
+
+
+class TilingDesigner(object):
+    """ Designs a tiling of overlapping amplicons across a region of a
+    template, like the ARTIC amplicon schemes: a chain of primer pairs
+    of which the amplicons (primers included) cover the region, and
+    every amplicon overlaps the next one by at least the requested
+    overlap. The amplicons are numbered from 1 and are meant for two
+    pools, the odd and even amplicons, so overlapping amplicons are
+    never amplified together.
+    The candidates are found once for the whole anneal range of the
+    finder, of which max_pcr_product is the maximum amplicon size.
+    Every forward primer gets a tile, the pair with the biggest
+    amplicon which passes the checks of the finder, see `best_tile`.
+    The chain with the fewest amplicons (and then the smallest summed
+    melting temperature difference) is found with dynamic programming
+    over the tiles, see `solve`.
+    """
+
+    # The maximum amount of reverse primers of a forward primer of
+    # which the dimers are checked at once
+    TILE_BLOCK_SIZE = 16
+
+    def __init__(self, finder, region_minimum, region_maximum, overlap):
+        """ Creates the designer of a region.
+
+        Parameters:
+            finder - The AllPrimerFinder of which the anneal range
+            contains the region and of which the max_pcr_product is the
+            maximum amplicon size.
+            region_minimum - The first position of the region
+            region_maximum - The last position of the region
+            overlap - The minimum overlap of two amplicons
+        Returns:
+            -
+        """
+        self.finder = finder
+        # Like the anneal range, the region is kept zero based with an
+        # exclusive end
+        self.region_minimum = region_minimum - 1
+        self.region_maximum = region_maximum
+        self.overlap = overlap
+
+    def best_tile(self, primers, buckets, forward_index, reverse_sequences):
+        """ Finds the pair of a forward primer with the biggest amplicon
+        which passes the range_primer_filter and dimer check of the
+        finder. The reverse primers are filtered and checked for dimers
+        in blocks, which start with a single primer and grow up to
+        TILE_BLOCK_SIZE primers, since the first ones usually pass.
+
+        Parameters:
+            primers - The PrimerCandidates of the template
+            buckets - The buckets from `AllPrimerFinder.index_primers`
+            forward_index - The index of the forward primer
+            reverse_sequences - The reverse complements by index, see
+            `AllPrimerFinder.reverse_sequence`.
+        Returns:
+            The index of the reverse primer, or None
+        """
+        finder = self.finder
+        primer_filter = finder.range_primer_filter(primers, forward_index)
+        reverse_indexes = finder.reverse_candidates(buckets, primers,
+                                                    forward_index)
+        finder.report_progress('pairs', len(reverse_indexes))
+        block = []
+        block_size = 1
+        for position, reverse_index in enumerate(reverse_indexes):
+            if primer_filter(reverse_index):
+                block.append(reverse_index)
+            if block and (len(block) == block_size or
+                          position == len(reverse_indexes) - 1):
+                match = finder.match_block(primers, [forward_index],
+                                           [block], reverse_sequences)
+                if match is not None:
+                    return match[1]
+                block = []
+                block_size = min(block_size * 2, self.TILE_BLOCK_SIZE)
+        return None
+
+    def find_tiles(self, primers):
+        """ Finds the tile of every forward primer which can be part of
+        a tiling of the region.
+
+        Parameters:
+            primers - The PrimerCandidates of the template, in order of
+            offset.
+        Returns:
+            A list of (start, end, melting temperature difference,
+            forward index, reverse index) tuples, in order of start. The
+            start and end of the amplicon are zero based and the end is
+            exclusive.
+        """
+        finder = self.finder
+        buckets = finder.index_primers(primers)
+        reverse_sequences = {}
+        offsets = primers.offsets
+        tiles = []
+        for forward_index in range(len(primers)):
+            start = finder.anneal_minimum + offsets[forward_index]
+            if start + self.overlap > self.region_maximum:
+                break
+            reverse_index = self.best_tile(primers, buckets, forward_index,
+                                           reverse_sequences)
+            if reverse_index is None:
+                continue
+            end = (finder.anneal_minimum + offsets[reverse_index] +
+                   primers.lengths[reverse_index])
+            if end <= self.region_minimum:
+                continue
+            tiles.append((start, end,
+                          abs(primers.melt_temps[reverse_index] -
+                              primers.melt_temps[forward_index]),
+                          forward_index, reverse_index))
+        return tiles
+
+    def solve(self, tiles):
+        """ Chains the tiles with dynamic programming. The cost of the
+        best chain ending with a tile is the cost of the best tile it
+        can follow plus its own: one amplicon and its melting
+        temperature difference. A tile can follow the tiles which start
+        before it and end at least overlap after its start. The tiles
+        are handled in order of start, so a tile which ends too early
+        for one tile also does for every later tile; the candidates to
+        follow are kept in a heap by cost, from which those are removed
+        once they reach the top. This takes O(n log n) for n tiles.
+
+        Parameters:
+            tiles - The tiles from `find_tiles`
+        Returns:
+            A list with the indexes of the tiles of the best chain in
+            order, or None when the region cannot be covered.
+        """
+        heap = []
+        # The tiles with the same start, which cannot follow each other
+        waiting = []
+        parents = [None] * len(tiles)
+        best = None
+        for index, (start, end, difference, _, _) in enumerate(tiles):
+            if waiting and tiles[waiting[0][2]][0] < start:
+                for item in waiting:
+                    heappush(heap, item)
+                waiting = []
+            if start <= self.region_minimum:
+                cost = (1, difference)
+            else:
+                while heap and heap[0][1] - start < self.overlap:
+                    heappop(heap)
+                if not heap:
+                    continue
+                (count, differences), _, parent = heap[0]
+                if end <= tiles[parent][1]:
+                    continue
+                cost = (count + 1, differences + difference)
+                parents[index] = parent
+            if end >= self.region_maximum:
+                if best is None or cost < best[0]:
+                    best = cost, index
+            else:
+                waiting.append((cost, end, index))
+        if best is None:
+            return None
+        chain = [best[1]]
+        while parents[chain[-1]] is not None:
+            chain.append(parents[chain[-1]])
+        chain.reverse()
+        return chain
+
+    def design(self):
+        """ Designs the tiling of the region.
+
+        Parameters:
+            -
+        Returns:
+            A list of matches like `AllPrimerFinder.find_primers`
+            returns, in order of the region, or None when the region
+            cannot be covered.
+        """
+        finder = self.finder
+        primers = finder.find_candidates()
+        with finder.report.stage('tiling'):
+            tiles = self.find_tiles(primers)
+            chain = self.solve(tiles)
+        if chain is None:
+            return None
+        return [finder.create_match(primers[tiles[index][3]],
+                                    primers[tiles[index][4]])
+                for index in chain]
@@ -0,0 +1,34 @@
+import random
+import unittest
+from BatchDesigner import design_multiplex
+
+
+def random_sequence(length, seed, nucleotides="ACGT"):
+    """ Creates a reproducible random sequence of nucleotides. """
+    generator = random.Random(seed)
+    return "".join(generator.choice(nucleotides) for _ in range(length))
+
+
+class DesignMultiplexTest(unittest.TestCase):
+    """ Checks that a target which cannot be designed does not stop the
+    other targets of a multiplex panel.
+    """
+
+    def test_unknown_nucleotide(self):
+        records = [("good", random_sequence(2000, 5)),
+                   ("bad", random_sequence(2000, 5, "ACGTN"))]
+        settings = dict(anneal_minimum=1, anneal_maximum=2000, max_pcr=300)
+        results = design_multiplex(
+            records, [("good", settings), ("bad", settings),
+                      ("missing", settings)], {})
+        self.assertEqual([result["name"] for result in results],
+                         ["good", "bad", "missing"])
+        self.assertEqual(results[0]["status"], "found")
+        self.assertTrue(results[0]["fprimer"])
+        self.assertEqual(results[1]["status"], "error")
+        self.assertEqual(results[1]["error"], "KeyError: 'N'")
+        self.assertEqual(results[2]["status"], "no sequence")
+
+
+if __name__ == '__main__':
+    unittest.main()
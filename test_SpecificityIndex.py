@@ -0,0 +1,43 @@
+import random
+import unittest
+from SpecificityIndex import SpecificityIndex
+
+
+def random_sequence(length, seed, nucleotides="ACGT"):
+    """ Creates a reproducible random sequence of nucleotides. """
+    generator = random.Random(seed)
+    return "".join(generator.choice(nucleotides) for _ in range(length))
+
+
+class SpecificityIndexTest(unittest.TestCase):
+    """ Checks the seed positions of the index against a plain search of
+    the template, for seeds longer than the prefix of the table too.
+    """
+
+    def assert_seed_positions(self, template, seed_length):
+        index = SpecificityIndex(template, seed_length)
+        for start in range(len(template) - seed_length + 1):
+            seed = template[start:start + seed_length]
+            expected = [other for other in
+                        range(len(template) - seed_length + 1)
+                        if template[other:other + seed_length] == seed]
+            if "N" in seed:
+                expected = []
+            self.assertEqual(list(index.seed_positions(seed)), expected)
+
+    def test_seed_positions(self):
+        template = random_sequence(300, 1, "ACGTN")
+        template += template[:100]
+        for seed_length in (1, 4, 10, 17):
+            self.assert_seed_positions(template, seed_length)
+
+    def test_table_follows_template(self):
+        index = SpecificityIndex("ACGT" * 100, seed_length=17)
+        self.assertEqual(index.prefix_length, 4)
+        self.assertEqual(len(index.starts), 4 ** 4 + 1)
+        self.assertEqual(list(index.seed_positions(("ACGT" * 5)[:17])),
+                         list(range(0, 400 - 16, 4)))
+
+
+if __name__ == '__main__':
+    unittest.main()
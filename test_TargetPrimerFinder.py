@@ -0,0 +1,150 @@
+import random
+import unittest
+from CandidateStore import CandidateSession
+from PrimerChecker import PrimerChecker
+from SearchReport import SearchReport
+from TargetPrimerFinder import TargetPrimerFinder
+
+
+class UnprunedTargetPrimerFinder(TargetPrimerFinder):
+    """ A TargetPrimerFinder which checks every candidate, like the
+    searches before the candidates out of reach were pruned.
+    """
+
+    def candidate_bounds(self):
+        return None
+
+
+def random_sequence(length, seed):
+    """ Creates a reproducible random sequence of nucleotides. """
+    generator = random.Random(seed)
+    return "".join(generator.choice("ACGT") for _ in range(length))
+
+
+class TargetPrimerFinderTest(unittest.TestCase):
+    """ Pins the target semantics of the TargetPrimerFinder: the forward
+    primer starts before target_minimum and the reverse primer ends
+    after target_maximum, in absolute positions, and pruning the
+    candidates out of reach of the target does not change the pairs.
+    """
+
+    SEQUENCE = random_sequence(3000, 7)
+    # The pairs of the searches, enough to find pairs at the bounds
+    PAIRS = 200
+
+    def setUp(self):
+        self.checker = PrimerChecker(required_bonds=10)
+
+    def create_finder(self, finder_class=TargetPrimerFinder,
+                      sequence=None, anneal_minimum=1, anneal_maximum=3000,
+                      max_pcr_product=400, target_minimum=1400,
+                      target_maximum=1500):
+        return finder_class(self.checker, sequence or self.SEQUENCE,
+                            anneal_minimum, anneal_maximum, max_pcr_product,
+                            target_minimum, target_maximum)
+
+    def pair_positions(self, matches):
+        return [(match['fprimer']['position'], match['rprimer']['position'])
+                for match in matches]
+
+    def test_candidate_bounds(self):
+        finder = self.create_finder()
+        self.assertEqual(finder.candidate_bounds(),
+                         ((1100, 1398), (1500, 1798)))
+        finder = self.create_finder(anneal_minimum=101)
+        self.assertEqual(finder.candidate_bounds(),
+                         ((1000, 1298), (1400, 1698)))
+
+    def test_pairs_within_bounds(self):
+        finder = self.create_finder()
+        matches = finder.find_ranked_pairs(self.PAIRS)
+        self.assertTrue(matches)
+        for (forward_start, _), (_, reverse_end) in \
+                self.pair_positions(matches):
+            self.assertTrue(forward_start <= finder.target_minimum - 1)
+            self.assertTrue(reverse_end >= finder.target_maximum + 1)
+            self.assertTrue(reverse_end - forward_start <=
+                            finder.max_pcr_product)
+
+    def test_pairs_at_bounds(self):
+        # The bounds of a target just around a pair and a PCR product of
+        # exactly its length only leave that pair
+        matches = self.create_finder().find_ranked_pairs(self.PAIRS)
+        forward, reverse = self.pair_positions(matches)[0]
+        arguments = dict(max_pcr_product=reverse[1] - forward[0],
+                         target_minimum=forward[0] + 1,
+                         target_maximum=reverse[1] - 1)
+        finder = self.create_finder(**arguments)
+        offset = forward[0] - finder.anneal_minimum - 1
+        reverse_offset = reverse[1] - finder.anneal_minimum - 1
+        self.assertEqual(finder.candidate_bounds(),
+                         ((offset, offset), (reverse_offset, reverse_offset)))
+        self.assertEqual(self.pair_positions(finder.find_ranked_pairs(1)),
+                         [(forward, reverse)])
+        for key in arguments:
+            moved = dict(arguments)
+            moved[key] += -1 if key != 'target_maximum' else 1
+            finder = self.create_finder(**moved)
+            self.assertNotIn((forward, reverse), self.pair_positions(
+                finder.find_ranked_pairs(self.PAIRS)))
+
+    def compare_unpruned(self, configure):
+        """ Compares the best and ranked pairs of a pruned and an
+        unpruned search, both set up by configure.
+        """
+        results = []
+        for finder_class in (TargetPrimerFinder, UnprunedTargetPrimerFinder):
+            finder = self.create_finder(finder_class)
+            configure(finder)
+            # A CandidateStore only selects the candidates once
+            finder.report = SearchReport(True)
+            best = finder.find_primers()
+            ranked = finder.find_ranked_pairs(self.PAIRS)
+            results.append((best and self.pair_positions([best]),
+                            self.pair_positions(ranked),
+                            finder.report.rejections.get('out_of_reach', 0)))
+        (pruned_best, pruned_ranked, out_of_reach), (best, ranked, _) = \
+            results
+        self.assertTrue(ranked)
+        self.assertTrue(out_of_reach)
+        self.assertEqual(pruned_best, best)
+        self.assertEqual(pruned_ranked, ranked)
+
+    def test_out_of_reach_serial(self):
+        self.compare_unpruned(lambda finder: None)
+
+    def test_out_of_reach_parallel(self):
+        def configure(finder):
+            finder.processes = 2
+            finder.PARALLEL_CHUNK_SIZE = 500
+        self.compare_unpruned(configure)
+
+    def test_out_of_reach_candidate_store(self):
+        def configure(finder):
+            finder.candidate_store = CandidateSession().store_for(finder)
+        self.compare_unpruned(configure)
+
+    def test_target_with_anneal_minimum(self):
+        # The target is in absolute positions, so moving the annealing
+        # sequence to the start of the template moves the pairs along
+        shift = 500
+        finder = self.create_finder(anneal_minimum=shift + 1)
+        shifted = self.create_finder(sequence=self.SEQUENCE[shift:],
+                                     anneal_maximum=3000 - shift,
+                                     target_minimum=1400 - shift,
+                                     target_maximum=1500 - shift)
+        matches = self.pair_positions(finder.find_ranked_pairs(self.PAIRS))
+        self.assertTrue(matches)
+        self.assertEqual(
+            matches,
+            [((forward_start + shift, forward_end + shift),
+              (reverse_start + shift, reverse_end + shift))
+             for (forward_start, forward_end), (reverse_start, reverse_end)
+             in self.pair_positions(shifted.find_ranked_pairs(self.PAIRS))])
+        for (forward_start, _), (_, reverse_end) in matches:
+            self.assertTrue(forward_start < finder.target_minimum)
+            self.assertTrue(reverse_end > finder.target_maximum)
+
+
+if __name__ == '__main__':
+    unittest.main()